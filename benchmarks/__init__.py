@@ -0,0 +1,3 @@
+"""
+Offline end-to-end benchmarks for the pipeline. Run with `python3 -m benchmarks.run`.
+"""
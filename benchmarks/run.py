@@ -0,0 +1,240 @@
+"""
+run.py
+
+Offline end-to-end benchmark of ingest -> process -> generate_images.
+
+The real pipeline code runs against the local stand-ins in benchmarks/standins.py, at 1x, 10x and 100x the
+replayable corpus. Each scale gets its own scratch workspace and each stage runs in a fresh subprocess, so memory
+held by one stage never counts towards the next one's peak. For each stage the benchmark reports throughput,
+p50/p95 item latency, peak RSS and how far RSS grew during the stage. Results are saved under benchmarks/results/ tagged with the git commit, and compared with
+the previous results file (or one given with --compare).
+
+    python3 -m benchmarks.run
+    python3 -m benchmarks.run --scales 1 10 --llm-latency 0.2
+    python3 -m benchmarks.run --scales 1 --max-articles 5 --no-save
+
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+
+from benchmarks.standins import (
+    REPO_ROOT, StandinServer, load_corpus, load_photos,
+    make_journal_handler, make_openai_handler, make_pexels_handler,
+)
+
+STAGES = ["ingest", "process", "generate_images"]
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+
+class RssSampler:
+    """
+    Tracks this process's peak resident set size while running, by polling /proc.
+
+    Falls back to the lifetime peak from getrusage where /proc isn't available (e.g. macOS), which is
+    still the stage's peak since each stage runs in its own process.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.start = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def current_rss():
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes on Linux
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    def _run(self):
+        while True:
+            self.peak = max(self.peak, self.current_rss())
+            if self._stop.wait(self.interval):
+                break
+
+    def __enter__(self):
+        self.start = self.current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current_rss())
+
+# -------------------- Child: run the pipeline --------------------
+
+def run_stage(stage, result_path):
+    """
+    Run one stage in this process (cwd is the scratch workspace) and write its results as JSON.
+
+    Stages hand over to each other through the workspace's data/ and output/ files, as in a real run.
+    """
+    # Imported here so the layers pick up the stand-in environment and the workspace's relative paths
+    from layers import metrics
+    from layers.ingestion import ingest
+    from layers.processing import process
+    from layers.contentGeneration import generate_images
+
+    stage_funcs = {
+        "ingest": lambda: ingest(delay=0),
+        "process": process,
+        "generate_images": generate_images,
+    }
+    metrics.reset()
+    with RssSampler() as rss:
+        started = time.perf_counter()
+        stage_funcs[stage]()
+        seconds = time.perf_counter() - started
+    summary = metrics.build_report()["stages"].get(stage, {})
+    items = summary.get("items", {})
+    item_seconds = summary.get("item_seconds", {})
+    result = {
+        "seconds": round(seconds, 3),
+        "items": items.get("ok", 0),
+        "errors": items.get("error", 0),
+        "throughput_per_second": round(items.get("ok", 0) / seconds, 3) if seconds else None,
+        "p50_ms": round(item_seconds["p50"] * 1000, 2) if item_seconds.get("p50") is not None else None,
+        "p95_ms": round(item_seconds["p95"] * 1000, 2) if item_seconds.get("p95") is not None else None,
+        "peak_rss_mb": round(rss.peak / 1024 / 1024, 1),
+        "rss_growth_mb": round((rss.peak - rss.start) / 1024 / 1024, 1),
+    }
+    with open(result_path, "w") as f:
+        json.dump(result, f, indent=2)
+
+# -------------------- Parent: stand-ins and scales --------------------
+
+def prepare_workspace(workspace, journal_urls):
+    os.makedirs(os.path.join(workspace, "data"))
+    os.makedirs(os.path.join(workspace, "output"))
+    os.symlink(os.path.join(REPO_ROOT, "fonts"), os.path.join(workspace, "fonts"))
+    with open(os.path.join(workspace, "data", "journals.json"), "w") as f:
+        json.dump(journal_urls, f)
+
+def run_scale(scale, corpus, photos, llm_latency=0.05, pexels_latency=0.0, keep_workspace=False):
+    journal_site = StandinServer(make_journal_handler(corpus, scale))
+    openai_api = StandinServer(make_openai_handler(llm_latency))
+    pexels_api = StandinServer(make_pexels_handler(photos, pexels_latency))
+    workspace = tempfile.mkdtemp(prefix=f"csiro-bench-{scale}x-")
+    with journal_site, openai_api, pexels_api:
+        prepare_workspace(workspace, [f"{journal_site.url}/{code}" for code in corpus])
+        env = dict(
+            os.environ,
+            PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])),
+            OPENAI_API_KEY="benchmark",
+            OPENAI_BASE_URL=f"{openai_api.url}/v1",
+            PEXELS_API_KEY="benchmark",
+            PEXELS_API_URL=f"{pexels_api.url}/v1",
+        )
+        stages = {}
+        for stage in STAGES:
+            result_path = os.path.join(workspace, f"{stage}_result.json")
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.run", "--child", stage, result_path],
+                cwd=workspace, env=env, check=True,
+            )
+            with open(result_path) as f:
+                stages[stage] = json.load(f)
+    if keep_workspace:
+        print(f"Workspace for {scale}x kept at {workspace}")
+    else:
+        shutil.rmtree(workspace, ignore_errors=True)
+    return {"scale": scale, "articles": scale * sum(len(entries) for entries in corpus.values()), "stages": stages}
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def format_runs(runs, baseline=None) -> str:
+    baseline_stages = {(run["scale"], stage): result for run in (baseline or {}).get("runs", []) for stage, result in run["stages"].items()}
+    lines = [f"{'scale':>6} {'stage':<16} {'items':>7} {'err':>5} {'items/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'peak MB':>8} {'+MB':>7}  vs baseline"]
+    for run in runs:
+        for stage, result in run["stages"].items():
+            delta = ""
+            previous = baseline_stages.get((run["scale"], stage))
+            if previous and previous.get("throughput_per_second") and result.get("throughput_per_second") is not None:
+                change = result["throughput_per_second"] / previous["throughput_per_second"] - 1
+                delta = f"{change:+.1%} items/s"
+            lines.append(
+                f"{str(run['scale']) + 'x':>6} {stage:<16} {result['items']:>7} {result['errors']:>5} "
+                f"{result['throughput_per_second'] or 0:>10.2f} {result['p50_ms'] or 0:>9.2f} {result['p95_ms'] or 0:>9.2f} "
+                f"{result['peak_rss_mb']:>8.1f} {result.get('rss_growth_mb', 0):>7.1f}  {delta}"
+            )
+    return "\n".join(lines)
+
+def latest_results(exclude=None):
+    paths = sorted(p for p in glob.glob(os.path.join(RESULTS_DIR, "*.json")) if p != exclude)
+    return paths[-1] if paths else None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help="Corpus multipliers to run")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds the fake OpenAI endpoint waits per call")
+    parser.add_argument("--pexels-latency", type=float, default=0.0, help="Seconds the fake Pexels API waits per request")
+    parser.add_argument("--max-articles", type=int, default=None, help="Cap the 1x corpus, for quick smoke runs")
+    parser.add_argument("--compare", default=None, help="Results file to compare against (default: the latest saved)")
+    parser.add_argument("--no-save", action="store_true", help="Don't save results under benchmarks/results/")
+    parser.add_argument("--keep-workspace", action="store_true", help="Keep each scale's scratch workspace for inspection")
+    parser.add_argument("--child", nargs=2, metavar=("STAGE", "RESULT_PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_stage(*args.child)
+        return None
+
+    corpus = load_corpus(max_articles=args.max_articles)
+    photos = load_photos()
+    runs = []
+    for scale in args.scales:
+        print(f"Running {scale}x corpus...", flush=True)
+        runs.append(run_scale(scale, corpus, photos, args.llm_latency, args.pexels_latency, args.keep_workspace))
+
+    results = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": {"llm_latency": args.llm_latency, "pexels_latency": args.pexels_latency, "max_articles": args.max_articles},
+        "runs": runs,
+    }
+    baseline_path = args.compare or latest_results()
+    baseline = None
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        print(f"Comparing with {os.path.relpath(baseline_path, REPO_ROOT)} ({baseline.get('commit')})")
+    print(format_runs(runs, baseline))
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{results['commit']}.json")
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {os.path.relpath(path, REPO_ROOT)}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
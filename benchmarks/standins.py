@@ -0,0 +1,270 @@
+"""
+standins.py
+
+Local stand-ins for every service the pipeline calls, so the benchmarks run offline and give repeatable numbers:
+
+- a journal site that serves listing pages built from data/links/*.json and replays the article pages in data/raw/
+- a fake OpenAI-compatible Responses endpoint with a configurable latency
+- a fake Pexels API that serves renditions of local JPEGs
+
+The journal site can multiply the corpus. At scale N each article also appears N-1 more times as a replica
+with its own URL, title and DOI, so every layer treats the replicas as separate articles.
+
+"""
+
+import os
+import re
+import io
+import glob
+import json
+import time
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from PIL import Image
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DOI_PATTERN = re.compile(r'<meta name="citation_doi" content="10\.1071/([^"]+)">')
+REPLICA_PATTERN = re.compile(r"^(?P<article_id>[A-Za-z]+\d+)(?:-r(?P<replica>\d+))?$")
+
+# Approximate height of each Pexels rendition. None serves the source file unchanged.
+PEXELS_RENDITIONS = {
+    "original": None,
+    "large2x": 1300,
+    "large": 650,
+    "medium": 350,
+    "small": 130,
+    "portrait": 1200,
+    "landscape": 627,
+    "tiny": 200,
+}
+
+
+class StandinServer:
+    """
+    Serves a request handler on a free localhost port from a background thread.
+    """
+
+    def __init__(self, handler_class):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    # Keep-alive like the real services
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body: bytes, content_type="text/html; charset=utf-8"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, payload, status=200):
+        self.send_body(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+# -------------------- Journal Site --------------------
+
+def load_corpus(raw_dir=None, links_dir=None, max_articles=None) -> dict:
+    """
+    Group the replayable article pages by journal code, in the order the journal's links file lists them.
+
+    :return: {journal code: [(article id, page html), ...]}, e.g. {"wf": [("WF24140", "<html>...")]}
+    """
+    raw_dir = raw_dir or os.path.join(REPO_ROOT, "data", "raw")
+    links_dir = links_dir or os.path.join(REPO_ROOT, "data", "links")
+
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(raw_dir, "*.html"))):
+        with open(path, "r", encoding="utf-8") as f:
+            html = f.read()
+        match = DOI_PATTERN.search(html)
+        if match:
+            pages[match.group(1)] = html
+
+    corpus = {}
+    for path in sorted(glob.glob(os.path.join(links_dir, "*_links.json"))):
+        code = os.path.basename(path)[:-len("_links.json")]
+        with open(path, "r") as f:
+            for link in json.load(f):
+                article_id = link.rstrip("/").rsplit("/", 1)[-1]
+                if article_id in pages:
+                    corpus.setdefault(code, []).append((article_id, pages.pop(article_id)))
+    # Pages no links file mentions still belong to the journal their DOI names
+    for article_id, html in pages.items():
+        code = re.match(r"[A-Za-z]+", article_id).group(0).lower()
+        corpus.setdefault(code, []).append((article_id, html))
+
+    if max_articles is not None:
+        kept, remaining = {}, max_articles
+        for code, articles in corpus.items():
+            if remaining <= 0:
+                break
+            kept[code] = articles[:remaining]
+            remaining -= len(kept[code])
+        corpus = kept
+    return corpus
+
+def replica_page(html: str, replica: int) -> str:
+    """
+    Give a replayed article page a distinct title, DOI and PDF link for replica number `replica`.
+    """
+    if not replica:
+        return html
+    html = re.sub(r'(<meta name="citation_title" content="[^"]*)"', rf'\1 (replica {replica})"', html, count=1)
+    html = re.sub(r'(<meta name="citation_doi" content="[^"]*)"', rf'\1-r{replica}"', html, count=1)
+    html = re.sub(r'(<meta name="citation_pdf_url" content="[^"]*)"', rf'\1-r{replica}"', html, count=1)
+    return html
+
+def make_journal_handler(corpus: dict, scale: int = 1):
+    articles = {article_id: html for entries in corpus.values() for article_id, html in entries}
+
+    class JournalHandler(QuietHandler):
+        def do_GET(self):
+            parts = [part for part in urlparse(self.path).path.split("/") if part]
+            if len(parts) == 1 and parts[0] in corpus:
+                self.send_body(200, self.listing(parts[0]).encode("utf-8"))
+            elif len(parts) == 2 and (match := REPLICA_PATTERN.match(parts[1])) and match.group("article_id") in articles:
+                html = replica_page(articles[match.group("article_id")], int(match.group("replica") or 0))
+                self.send_body(200, html.encode("utf-8"))
+            else:
+                self.send_body(404, b"Not found")
+
+        def listing(self, code):
+            # Same shape as the real listing: crawl_journal looks for <article><h3><a href>
+            items = []
+            for article_id, _ in corpus[code]:
+                for replica in range(scale):
+                    suffix = f"-r{replica}" if replica else ""
+                    items.append(f'<article><h3><a href="/{code.upper()}/{article_id}{suffix}">{article_id}{suffix}</a></h3></article>')
+            return "<html><body>" + "\n".join(items) + "</body></html>"
+
+    return JournalHandler
+
+# -------------------- OpenAI --------------------
+
+def fake_post(prompt: str) -> dict:
+    digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+    return {
+        "hook": f"Science you can use today, episode {digest[:6]}!",
+        "caption": "A benchmark caption standing in for the generated post. " * 8,
+        "hashtags": ["Science", "CSIRO", "Benchmark"],
+        "image_prompt": f"landscape {digest[:4]}",
+    }
+
+def make_openai_handler(latency: float = 0.05):
+    class OpenAIHandler(QuietHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if urlparse(self.path).path.rstrip("/") != "/v1/responses":
+                self.send_json({"error": {"message": "Not found"}}, status=404)
+                return
+            request = json.loads(body or b"{}")
+            prompt = json.dumps(request.get("input", ""))
+            time.sleep(latency)
+            text = json.dumps(fake_post(prompt))
+            self.send_json({
+                "id": "resp_bench",
+                "object": "response",
+                "created_at": int(time.time()),
+                "model": request.get("model", "bench"),
+                "status": "completed",
+                "output": [{
+                    "type": "message",
+                    "id": "msg_bench",
+                    "status": "completed",
+                    "role": "assistant",
+                    "content": [{"type": "output_text", "text": text, "annotations": []}],
+                }],
+                "parallel_tool_calls": True,
+                "tool_choice": "auto",
+                "tools": [],
+                "usage": {
+                    "input_tokens": len(prompt) // 4,
+                    "input_tokens_details": {"cached_tokens": 0},
+                    "output_tokens": len(text) // 4,
+                    "output_tokens_details": {"reasoning_tokens": 0},
+                    "total_tokens": (len(prompt) + len(text)) // 4,
+                },
+            })
+
+    return OpenAIHandler
+
+# -------------------- Pexels --------------------
+
+def load_photos(paths=None) -> list:
+    """
+    Pre-encode every Pexels rendition of the local JPEGs.
+
+    :return: [{rendition name: jpeg bytes}, ...]
+    """
+    paths = paths or sorted(glob.glob(os.path.join(REPO_ROOT, "output", "*.jpg")) + [os.path.join(REPO_ROOT, "test_post.jpg")])
+    photos = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            original = f.read()
+        renditions = {}
+        with Image.open(io.BytesIO(original)) as image:
+            image = image.convert("RGB")
+            for name, height in PEXELS_RENDITIONS.items():
+                if height is None:
+                    renditions[name] = original
+                    continue
+                resized = image.resize((max(1, round(image.width * height / image.height)), height))
+                buffer = io.BytesIO()
+                resized.save(buffer, "JPEG")
+                renditions[name] = buffer.getvalue()
+        photos.append(renditions)
+    if not photos:
+        raise FileNotFoundError("No local JPEGs found to serve as Pexels photos")
+    return photos
+
+def make_pexels_handler(photos: list, latency: float = 0.0):
+    class PexelsHandler(QuietHandler):
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            query = parse_qs(parsed.query)
+            time.sleep(latency)
+            if parsed.path.rstrip("/") == "/v1/search":
+                prompt = query.get("query", [""])[0]
+                idx = int(hashlib.sha1(prompt.encode("utf-8")).hexdigest(), 16) % len(photos)
+                base = f"http://{self.headers['Host']}/photos/{idx}.jpg"
+                self.send_json({"photos": [{
+                    "src": {name: f"{base}?size={name}" for name in PEXELS_RENDITIONS},
+                    "photographer": "Benchmark Photographer",
+                }]})
+            elif (match := re.fullmatch(r"/photos/(\d+)\.jpg", parsed.path)) and int(match.group(1)) < len(photos):
+                photo = photos[int(match.group(1))]
+                self.send_body(200, photo.get(query.get("size", ["original"])[0], photo["original"]), "image/jpeg")
+            else:
+                self.send_json({"error": "Not found"}, status=404)
+
+    return PexelsHandler
@@ -0,0 +1,109 @@
+"""
+daemon.py
+
+Long-running alternative to invoking orchestration.py from cron every 15 minutes.
+Imports the pipeline once and keeps the OpenAI client, fonts, crawled URL ledger and post store
+warm in memory, runs each stage on its own interval with jitter, and holds the pipeline lock
+while a stage runs so it never overlaps with a cron run.
+
+SIGTERM or SIGINT stops the running stage after the item (article or post) it is working on, so shutdown fits in
+a service manager's stop timeout. A second signal exits immediately.
+
+"""
+
+import time
+import random
+import logging
+import signal
+import argparse
+import threading
+
+from layers.ingestion import ingest, load_crawled_urls
+from layers.processing import process
+from layers.contentGeneration import generate_images
+from layers.store import PostStore
+from layers import metrics
+from orchestration import pipeline_lock, PipelineLocked, configure_console_logging, start_run, finish_run
+
+
+class Stage:
+    def __init__(self, name, func, interval, jitter=0.1):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.next_run = time.monotonic()
+
+    def schedule_next(self):
+        # Jitter spreads the stages out so they don't keep landing on the same tick
+        spread = self.interval * self.jitter
+        self.next_run = time.monotonic() + self.interval + random.uniform(-spread, spread)
+
+
+class PipelineDaemon:
+    def __init__(self, ingest_interval=6 * 60 * 60, process_interval=15 * 60, images_interval=15 * 60, jitter=0.1):
+        self.stop_event = threading.Event()
+        # Warm state shared across ticks
+        self.crawled_urls = load_crawled_urls()
+        self.store = PostStore()
+        self.stages = [
+            # Stages stop between items once stop_event is set
+            Stage("ingest", lambda: ingest(crawled_urls=self.crawled_urls, stop_event=self.stop_event), ingest_interval, jitter),
+            Stage("process", lambda: process(store=self.store, stop_event=self.stop_event), process_interval, jitter),
+            Stage("generate_images", lambda: generate_images(store=self.store, stop_event=self.stop_event), images_interval, jitter),
+        ]
+
+    def handle_signal(self, signum, frame):
+        if self.stop_event.is_set():
+            raise KeyboardInterrupt
+        logging.warning(f"Received signal {signum}, finishing the item in progress before exiting...")
+        self.stop_event.set()
+
+    def run_stage(self, stage):
+        start_run()
+        try:
+            with pipeline_lock():
+                logging.info(f"Running stage: {stage.name}")
+                with metrics.timer("stage_duration_seconds", stage=stage.name):
+                    stage.func()
+        except PipelineLocked as e:
+            logging.warning(f"{e}, postponing {stage.name}")
+        except Exception as e:
+            # Keep the daemon alive, the stage will be retried on its next interval
+            logging.exception(f"Stage {stage.name} failed: {e}")
+        finish_run()
+        stage.schedule_next()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        signal.signal(signal.SIGINT, self.handle_signal)
+        logging.info("Pipeline daemon started.")
+        try:
+            while not self.stop_event.is_set():
+                # Stages are listed in pipeline order, so ties run ingest -> process -> images
+                stage = min(self.stages, key=lambda s: s.next_run)
+                wait = stage.next_run - time.monotonic()
+                if wait > 0 and self.stop_event.wait(wait):
+                    break
+                self.run_stage(stage)
+        finally:
+            self.store.close()
+        logging.info("Pipeline daemon stopped.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the pipeline as a long-running scheduler")
+    parser.add_argument("--ingest-interval", type=float, default=360, help="Minutes between journal crawls")
+    parser.add_argument("--process-interval", type=float, default=15, help="Minutes between processing runs")
+    parser.add_argument("--images-interval", type=float, default=15, help="Minutes between image generation runs")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Fraction of each interval to randomly jitter by")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"], help="Console log level")
+    args = parser.parse_args()
+    configure_console_logging(args.log_level)
+
+    PipelineDaemon(
+        ingest_interval=args.ingest_interval * 60,
+        process_interval=args.process_interval * 60,
+        images_interval=args.images_interval * 60,
+        jitter=args.jitter,
+    ).run()
@@ -5,7 +5,6 @@ The script also updates the article data with the image path and logs generated
 Error handling is included to catch and manage exceptions during image creation.
 """
 
-import requests
 from PIL import Image
 from io import BytesIO
 import os
@@ -13,11 +12,21 @@ import json
 import logging
 
 PEXELS_API_KEY = os.getenv("PEXELS_API_KEY")
+# Overridable so the benchmarks can point at a local stand-in
+PEXELS_API_URL = os.getenv("PEXELS_API_URL", "https://api.pexels.com/v1")
 
 from PIL import Image, ImageDraw, ImageFont
 from typing import Tuple
+from functools import lru_cache
+import math
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
+from layers.store import PostStore, LEGACY_POSTS_FILE, article_id, append_jsonl
+from layers.resilience import resilient_get
+from layers import metrics
+
 # Setup logging at the top of your file
 logging.basicConfig(
     filename="output/image_errors.log",
@@ -31,6 +40,40 @@ CAPTION_FONT = ImageFont.truetype("fonts/Inter-Regular.ttf", 44)
 HASHTAG_FONT = ImageFont.truetype("fonts/Inter-Regular.ttf", 36)
 ATTRIB_FONT = ImageFont.truetype("fonts/Inter-Italic.ttf", 24)
 
+POST_SIZE = 1080
+DRAFT_SIZE = 270
+# Posts that fail to render this many times are no longer retried
+MAX_RENDER_ATTEMPTS = 5
+
+
+@lru_cache(maxsize=None)
+def load_fonts(scale: float = 1.0) -> Tuple[ImageFont.FreeTypeFont, ImageFont.FreeTypeFont]:
+    """
+    Return the (title, attribution) fonts sized for a render scale, reusing the full size fonts at scale 1.
+    """
+    if scale == 1.0:
+        return TITLE_FONT, ATTRIB_FONT
+    return (
+        ImageFont.truetype("fonts/Inter-Bold.ttf", max(1, round(80 * scale))),
+        ImageFont.truetype("fonts/Inter-Italic.ttf", max(1, round(24 * scale))),
+    )
+
+
+def pexels_size_for(size: int) -> str:
+    """
+    Pick the smallest Pexels rendition that still covers a square of the given size.
+    """
+    # Pexels renditions: small is 130px tall, tiny 280x200, medium 350px tall, large 650px tall
+    if size <= 130:
+        return "small"
+    if size <= 200:
+        return "tiny"
+    if size <= 350:
+        return "medium"
+    if size <= 650:
+        return "large"
+    return "original"
+
 
 def fetch_pexels_image(query: str, size: str = "original") -> tuple[Image.Image, str]:
     """
@@ -40,7 +83,7 @@ def fetch_pexels_image(query: str, size: str = "original") -> tuple[Image.Image,
     :param size: Image size, one of: 'original', 'large2x', 'large', 'medium', 'small', 'portrait', 'landscape', 'tiny'
     :return: (Pillow Image object, photographer name)
     """
-    url = "https://api.pexels.com/v1/search"
+    url = f"{PEXELS_API_URL}/search"
     if not PEXELS_API_KEY:
         raise ValueError("PEXELS_API_KEY environment variable is not set.")
     if not query:
@@ -53,10 +96,8 @@ def fetch_pexels_image(query: str, size: str = "original") -> tuple[Image.Image,
         "per_page": 1
     }
 
-    response = requests.get(url, headers=headers, params=params)
-    print(f"Request URL: {response.url}")
-    print(f"Status Code: {response.status_code}")
-    print(f"Response Text: {response.text}")
+    response = resilient_get(url, headers=headers, params=params)
+    logging.debug(f"Pexels search {response.url} returned {response.status_code}")
     response.raise_for_status()
     data = response.json()
 
@@ -65,40 +106,56 @@ def fetch_pexels_image(query: str, size: str = "original") -> tuple[Image.Image,
     if not image_url:
         raise ValueError(f"Requested size '{size}' not available. Choose from: {', '.join(photo['src'].keys())}")
     
-    print(f"🔗 Downloading image: {image_url}")
-    image_response = requests.get(image_url)
+    logging.debug(f"Downloading image: {image_url}")
+    image_response = resilient_get(image_url)
+    image_response.raise_for_status()
     image = Image.open(BytesIO(image_response.content)).convert("RGBA")
 
     photographer = photo["photographer"]
     return image, photographer
 
 
-def create_post_image(post_data: dict) -> Image.Image:
+def create_post_image(post_data: dict, scale: float = 1.0) -> Image.Image:
     """
     Creates a social media post image from given post data and returns a Pillow Image.
+
+    :param post_data: Post dict with at least a hook and an image_prompt.
+    :param scale: Render scale relative to the 1080px post. Below 1 this is a draft render:
+        it downloads a smaller Pexels rendition and uses fast resampling.
     """
+    size = round(POST_SIZE * scale)
+    title_font, attrib_font = load_fonts(scale)
+    resample = Image.LANCZOS if scale >= 1 else Image.BILINEAR
+
+    def px(value):
+        # Layout measurements below are for the 1080px post
+        return round(value * scale)
+
     # === Unpack data ===
     hook = post_data.get("hook", "").encode('ascii', 'ignore').decode('ascii')
     image_prompt = post_data.get("image_prompt", "")
 
     # === Get and resize a background image ===
-    bg_image, photographer = fetch_pexels_image(image_prompt)
-    # resize without distorting the image by scaling it down to 1080 height
-    # and then cropping it to 1080 width
+    if scale >= 1:
+        bg_image, photographer = fetch_pexels_image(image_prompt)
+    else:
+        bg_image, photographer = fetch_pexels_image(image_prompt, size=pexels_size_for(size))
+    # resize without distorting the image by scaling it down to the post height
+    # and then cropping it to the post width
     if bg_image.width > bg_image.height:
-        bg_image = bg_image.resize((int(bg_image.width * (1080 / bg_image.height)), 1080), Image.LANCZOS)
-        bg_image = bg_image.crop((0, 0, 1080, 1080))
+        bg_image = bg_image.resize((max(size, int(bg_image.width * (size / bg_image.height))), size), resample)
+        bg_image = bg_image.crop((0, 0, size, size))
     else:
-        bg_image = bg_image.resize((1080, int(bg_image.height * (1080 / bg_image.width))), Image.LANCZOS)
-        # crop the image to 1080 width
+        bg_image = bg_image.resize((size, max(size, int(bg_image.height * (size / bg_image.width)))), resample)
+        # crop the image to the post width
         # and center it vertically
-        bg_image = bg_image.crop((int((bg_image.width - 1080) / 2), 0, int((bg_image.width + 1080) / 2), 1080))
-        # crop the image to 1080 height
+        bg_image = bg_image.crop((int((bg_image.width - size) / 2), 0, int((bg_image.width + size) / 2), size))
+        # crop the image to the post height
         # and center it horizontally
 
 
     draw = ImageDraw.Draw(bg_image)
-    margin = 60
+    margin = px(60)
     y = margin
 
     # === Draw the hook on top of the background ===
@@ -106,16 +163,16 @@ def create_post_image(post_data: dict) -> Image.Image:
     # and be over a white background
 
     # Measure how wide it will be
-    hook_lines = draw.textbbox((margin, y), hook, font=TITLE_FONT)
+    hook_lines = draw.textbbox((margin, y), hook, font=title_font)
     if hook_lines:
         hook_width = hook_lines[2] - hook_lines[0]
     else:
-        print("Warning: Unable to calculate text bounding box for the hook.")
+        logging.warning("Unable to calculate text bounding box for the hook.")
         hook_width = 0
 
     
     # If too wide for the bg image, draw a multiline hook
-    if hook_width > 1080 - 2 * margin:
+    if hook_width > size - 2 * margin:
         
         # Split the text into lines that fit within the image width
         words = hook.split()
@@ -123,8 +180,8 @@ def create_post_image(post_data: dict) -> Image.Image:
         current_line = ""
         for word in words:
             test_line = f"{current_line} {word}".strip()
-            test_width = draw.textbbox((margin, y), test_line, font=TITLE_FONT)[2] - margin
-            if test_width <= 1080 - 2 * margin:
+            test_width = draw.textbbox((margin, y), test_line, font=title_font)[2] - margin
+            if test_width <= size - 2 * margin:
                 current_line = test_line
             else:
                 lines.append(current_line)
@@ -136,13 +193,13 @@ def create_post_image(post_data: dict) -> Image.Image:
         # and draw a rectangle behind the text
         hook_height = 0
         for line in lines:
-            hook_height += TITLE_FONT.getbbox(line)[3] + 20
+            hook_height += title_font.getbbox(line)[3] + px(20)
 
         overlay = Image.new("RGBA", bg_image.size, (255, 255, 255, 0))
         overlay_draw = ImageDraw.Draw(overlay)
         overlay_draw.rounded_rectangle(
-            (margin - 10, y - 10, 1080 - margin + 10, y + hook_height + 10),
-            radius=20,
+            (margin - px(10), y - px(10), size - margin + px(10), y + hook_height + px(10)),
+            radius=px(20),
             fill=(255, 255, 255, 200)
         )
 
@@ -151,73 +208,243 @@ def create_post_image(post_data: dict) -> Image.Image:
         
         # Draw each line
         for line in lines:
-            print("Drawing line:", line)
-            draw.text((margin, y), line, font=TITLE_FONT, fill=(0, 0, 0, 255))
-            y += TITLE_FONT.getbbox(line)[3] + 20
+            draw.text((margin, y), line, font=title_font, fill=(0, 0, 0, 255))
+            y += title_font.getbbox(line)[3] + px(20)
             
     else:
         # If small enough draw the hook as a single line
-        draw.text((margin, y), hook, font=TITLE_FONT, fill=(0, 0, 0, 255))
-        y += TITLE_FONT.getbbox(hook)[3] + 20
+        draw.text((margin, y), hook, font=title_font, fill=(0, 0, 0, 255))
+        y += title_font.getbbox(hook)[3] + px(20)
 
-    y += TITLE_FONT.getbbox(hook)[3] + 40
+    y += title_font.getbbox(hook)[3] + px(40)
 
     # === Draw photo attribution (bottom-right)
     if photographer:
         attrib_text = f"Photo: {photographer} | Source: Pexels"
-        text_width = ATTRIB_FONT.getbbox(attrib_text)[2]
+        text_width = attrib_font.getbbox(attrib_text)[2]
         # Draw a semi-transparent black background for the attribution
         overlay = Image.new("RGBA", bg_image.size, (0, 0, 0, 0))
         overlay_draw = ImageDraw.Draw(overlay)
         overlay_draw.rectangle(
-            (1080 - text_width - 40, 1080 - 50, 1080 - 20, 1080 - 20),
+            (size - text_width - px(40), size - px(50), size - px(20), size - px(20)),
             fill=(0, 0, 0, 200)  # Adjust alpha here (0-255)
         )
         # Composite the overlay with the background image
         bg_image = Image.alpha_composite(bg_image.convert("RGBA"), overlay)
         draw = ImageDraw.Draw(bg_image)
-        draw.text((1080 - text_width - 40, 1080 - 50), attrib_text, font=ATTRIB_FONT, fill=(200, 200, 200, 255))
+        draw.text((size - text_width - px(40), size - px(50)), attrib_text, font=attrib_font, fill=(200, 200, 200, 255))
 
     return bg_image.convert("RGB")  # For saving to JPEG/PNG
 
-def load_generated_images(filepath="output/generated_images.txt"):
+def load_checkpoint(filepath="output/posts_checkpoint.txt") -> int:
+    """
+    Return the byte offset into posts.jsonl up to which every post has been rendered, skipped or recorded as failed.
+    """
     if not os.path.exists(filepath):
-        return set()
+        return 0
     with open(filepath, "r") as f:
-        return set(line.strip() for line in f)
-
-def save_generated_image(article_title, filepath="output/generated_images.txt"):
-    with open(filepath, "a") as f:
-        f.write(f"{article_title}\n")
+        try:
+            return int(f.read().strip() or 0)
+        except ValueError:
+            logging.error(f"Ignoring corrupt checkpoint file: {filepath}")
+            return 0
 
-def generate_images():
-    generated = load_generated_images()
-    # Count total lines for progress bar
-    with open("data/posts.jsonl") as f:
-        lines = f.readlines()
-    total = len(lines)
+def save_checkpoint(offset: int, filepath="output/posts_checkpoint.txt"):
+    # Write to a temp file first so a crash never leaves a half-written offset
+    tmp_path = f"{filepath}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(str(offset))
+    os.replace(tmp_path, filepath)
 
-    with tqdm(total=total, desc="Generating images") as pbar:
-        for line in lines:
-            post_data = json.loads(line)
-            title = post_data['article_title'][:50]
-            if title in generated:
-                pbar.update(1)
-                continue  # Skip already generated
+def iter_posts(posts_file="data/posts.jsonl", offset: int = 0):
+    """
+    Stream posts from an append-only JSONL file starting at a byte offset.
 
+    :param posts_file: Path to the JSONL file of posts.
+    :param offset: Byte offset to start reading from (must be at a line boundary).
+    :return: Generator of (post dict, byte offset just past that post's line, bytes read)
+    """
+    with open(posts_file, "rb") as f:
+        f.seek(offset)
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            if not line.endswith(b"\n"):
+                # A writer is still appending this record, pick it up next run
+                break
+            offset += len(line)
+            if not line.strip():
+                yield None, offset, len(line)
+                continue
             try:
-                img = create_post_image(post_data)
-                img.save(f"output/{title}.jpg", "JPEG")
-                post_data['image_path'] = f"output/{title}.jpg"
-                with open("output/posts_with_images.jsonl", "a") as out_f:
-                    out_f.write(json.dumps(post_data) + "\n")
-                save_generated_image(title)
-            except Exception as e:
-                logging.exception(f"Error generating image for {title}")
-            pbar.update(1)
+                post = json.loads(line)
+            except json.JSONDecodeError as e:
+                # A corrupt record must not block every record after it
+                logging.error(f"Skipping malformed line ending at byte {offset} of {posts_file}: {e}")
+                yield None, offset, len(line)
+                continue
+            yield post, offset, len(line)
+
+def render_post(post_data: dict, store) -> str:
+    """
+    Render a post, save the image to the store and append the post to posts_with_images.jsonl.
+
+    :return: Path of the saved image.
+    """
+    img = create_post_image(post_data)
+    buffer = BytesIO()
+    img.save(buffer, "JPEG")
+    post_data['image_path'] = store.save_image(article_id(post_data), buffer.getvalue())
+    store.upsert_post(post_data)
+    append_jsonl(LEGACY_POSTS_FILE, post_data)
+    return post_data['image_path']
+
+def make_contact_sheet(images: list, columns: int = None, tile_size: int = DRAFT_SIZE) -> Image.Image:
+    """
+    Lay draft renders out on a single grid image.
+    """
+    columns = columns or max(1, math.ceil(math.sqrt(len(images))))
+    rows = max(1, math.ceil(len(images) / columns))
+    sheet = Image.new("RGB", (columns * tile_size, rows * tile_size), (255, 255, 255))
+    for idx, img in enumerate(images):
+        if img.size != (tile_size, tile_size):
+            img = img.resize((tile_size, tile_size), Image.BILINEAR)
+        sheet.paste(img, ((idx % columns) * tile_size, (idx // columns) * tile_size))
+    return sheet
+
+def generate_drafts(posts_file="data/posts.jsonl", output_path="output/drafts/contact_sheet.jpg", scale=DRAFT_SIZE / POST_SIZE, limit=None, workers=8):
+    """
+    Render low resolution previews of posts onto one contact sheet.
+
+    Nothing is written to the store, the checkpoint or posts_with_images.jsonl, so drafts can be
+    re-run freely while tuning prompts or layouts.
+
+    :param scale: Render scale relative to the 1080px post, e.g. 0.25 for 270px tiles.
+    :param limit: Only preview the most recent `limit` posts.
+    :return: Path of the contact sheet, or None if there was nothing to render.
+    """
+    posts = list(deque((post for post, _, _ in iter_posts(posts_file) if post), maxlen=limit))
+    if not posts:
+        return None
+
+    def render(post_data):
+        try:
+            return create_post_image(post_data, scale=scale)
+        except Exception as e:
+            logging.exception(f"Error generating draft for {article_id(post_data)}")
+            return None
+
+    # Drafts are independent and mostly wait on Pexels, so fetch them concurrently
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        images = list(tqdm(executor.map(render, posts), total=len(posts), desc="Rendering drafts"))
+    images = [img for img in images if img is not None]
+    if not images:
+        return None
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    make_contact_sheet(images, tile_size=round(POST_SIZE * scale)).save(output_path, "JPEG")
+    return output_path
+
+def generate_images(posts_file="data/posts.jsonl", checkpoint_file="output/posts_checkpoint.txt", store=None, draft_scale=None, stop_event=None):
+    """
+    Render every post in posts_file that has no image yet, resuming from the checkpoint.
+
+    :param stop_event: Once set, stop before the next post. The checkpoint is saved so the next run resumes there.
+    """
+    if draft_scale:
+        return generate_drafts(posts_file, scale=draft_scale)
+    if not os.path.exists(posts_file):
+        return
+    own_store = store is None
+    if own_store:
+        store = PostStore()
+    try:
+        _generate_images(posts_file, checkpoint_file, store, stop_event)
+    finally:
+        if own_store:
+            store.close()
+
+def _render_or_record(post_data: dict, store) -> bool:
+    """
+    Render a post, recording it in the store's render failures if it fails so it is retried next run.
+    """
+    aid = article_id(post_data)
+    metrics.inc("cache_requests_total", cache="rendered_images", result="miss")
+    try:
+        with metrics.timer("item_duration_seconds", stage="generate_images"):
+            render_post(post_data, store)
+    except Exception as e:
+        logging.exception(f"Error generating image for {aid}")
+        metrics.inc("stage_items_total", stage="generate_images", result="error")
+        attempts = store.record_render_failure(post_data, str(e))
+        if attempts >= MAX_RENDER_ATTEMPTS:
+            logging.error(f"Giving up on {aid} after {attempts} failed renders")
+        return False
+    metrics.inc("stage_items_total", stage="generate_images", result="ok")
+    store.clear_render_failure(aid)
+    return True
+
+def _generate_images(posts_file, checkpoint_file, store, stop_event=None):
+    def stop_requested():
+        return stop_event is not None and stop_event.is_set()
+
+    # Retry posts that failed on earlier runs first, straight from the store
+    for post_data in store.render_failures(max_attempts=MAX_RENDER_ATTEMPTS):
+        if stop_requested():
+            return
+        if store.get_asset(article_id(post_data)):
+            store.clear_render_failure(article_id(post_data))
+        else:
+            _render_or_record(post_data, store)
+
+    # Progress is estimated from bytes so we never have to read the whole file up front
+    total = os.path.getsize(posts_file)
+    offset = load_checkpoint(checkpoint_file)
+    if offset > total:
+        # posts.jsonl was truncated or replaced since the last run, start over
+        offset = 0
+
+    # Failed posts are kept in the store, so the checkpoint always moves past them
+    checkpoint = offset
+    try:
+        with tqdm(total=total, initial=offset, unit="B", unit_scale=True, desc="Generating images") as pbar:
+            for post_data, next_offset, size in iter_posts(posts_file, offset):
+                if stop_requested():
+                    logging.info("Stop requested, saving the checkpoint for the next run")
+                    break
+                aid = article_id(post_data) if post_data else None
+                if aid and store.get_asset(aid):  # Skip already generated
+                    metrics.inc("cache_requests_total", cache="rendered_images", result="hit")
+                    metrics.inc("stage_items_total", stage="generate_images", result="skipped")
+                elif aid:
+                    _render_or_record(post_data, store)
+                checkpoint = next_offset
+                pbar.update(size)
+    finally:
+        # Keep this run's progress even if it is interrupted
+        save_checkpoint(checkpoint, checkpoint_file)
 
 if __name__ == "__main__":
+    import argparse
+    from layers.profiling import ProfileSession, maybe_profile, add_profile_arguments
+    parser = argparse.ArgumentParser(description="Generate post images")
+    parser.add_argument("--draft", action="store_true", help="Render a low resolution contact sheet instead of full posts")
+    parser.add_argument("--draft-size", type=int, default=DRAFT_SIZE, help="Draft tile size in pixels")
+    parser.add_argument("--limit", type=int, default=None, help="Only preview the most recent N posts")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    session = ProfileSession(args.profiler, args.profile_dir) if args.profile else None
+
     if not os.path.exists("output"):
         os.makedirs("output")
-    generate_images()
-    print("Image generation complete. Check the 'output' directory for results.")
\ No newline at end of file
+    if args.draft:
+        with maybe_profile(session, "generate_drafts"):
+            sheet = generate_drafts(scale=args.draft_size / POST_SIZE, limit=args.limit)
+        print(f"Draft contact sheet written to {sheet}")
+    else:
+        with maybe_profile(session, "generate_images"):
+            generate_images()
+        print("Image generation complete. Check the 'output' directory for results.")
+    if session is not None:
+        print(session.summary_text())
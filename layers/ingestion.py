@@ -13,6 +13,8 @@ import requests
 import pandas as pd
 from bs4 import BeautifulSoup
 import logging
+from layers.resilience import resilient_get
+from layers import metrics
 
 # -------------------- Setup Logging --------------------
 os.makedirs('data', exist_ok=True)
@@ -26,7 +28,7 @@ logging.basicConfig(
 
 def crawl_journal(journal_url):
     headers = {"User-Agent": "Mozilla/5.0"}
-    response = requests.get(journal_url, headers=headers)
+    response = resilient_get(journal_url, headers=headers)
     if response.status_code != 200:
         logging.error(f"Failed to retrieve journal page: {journal_url}, status code: {response.status_code}")
         return []
@@ -46,7 +48,7 @@ def crawl_journal(journal_url):
 
 def crawl_article(article_url):
     headers = {"User-Agent": "Mozilla/5.0"}
-    response = requests.get(article_url, headers=headers)
+    response = resilient_get(article_url, headers=headers)
     if response.status_code != 200:
         logging.error(f"Failed to retrieve article page: {article_url}, status code: {response.status_code}")
         return None
@@ -103,16 +105,33 @@ def load_journal_list(file_path='data/journals.json'):
     with open(file_path, 'r') as f:
         return json.load(f)
 
-def crawl_all_journals(journal_list, delay=2):
+def pause(delay, stop_event=None):
+    # Waiting on the stop event lets a shutting down daemon skip the rest of the politeness delay
+    if stop_event is not None:
+        stop_event.wait(delay)
+    else:
+        time.sleep(delay)
+
+def crawl_all_journals(journal_list, delay=2, stop_event=None):
     """
     Crawl all journals and return a list of all article links (deduplicated).
+
+    Stops before the next journal once `stop_event` is set.
     """
     all_links = set()
     for journal in journal_list:
+        if stop_event is not None and stop_event.is_set():
+            logging.info("Stop requested, not crawling the remaining journals")
+            break
         logging.info(f"Crawling journal: {journal}")
-        links = crawl_journal(journal)
+        try:
+            links = crawl_journal(journal)
+        except Exception as e:
+            # One unreachable journal shouldn't stop the others being crawled
+            logging.exception(f"Failed to crawl journal: {journal}")
+            continue
         all_links.update(links)
-        time.sleep(delay)
+        pause(delay, stop_event)
     return list(all_links)
 
 def load_crawled_urls(filepath='data/crawled_urls.txt'):
@@ -125,26 +144,56 @@ def save_crawled_url(url, filepath='data/crawled_urls.txt'):
     with open(filepath, 'a') as f:
         f.write(url + '\n')
 
-def crawl_all_articles(article_links, output_file='data/articles.csv', delay=2, error_log='data/ingestion_errors.log', crawled_file='data/crawled_urls.txt'):
-    crawled_urls = load_crawled_urls(crawled_file)
+def crawl_all_articles(article_links, output_file='data/articles.csv', delay=2, error_log='data/ingestion_errors.log', crawled_file='data/crawled_urls.txt', crawled_urls=None, stop_event=None):
+    """
+    Crawl every article not already in the crawled ledger.
+
+    Long-running callers can pass their own `crawled_urls` set to skip rereading the ledger;
+    it is updated in place as articles are saved. Stops before the next article once `stop_event` is set,
+    the rest are crawled on the next run.
+    """
+    if crawled_urls is None:
+        crawled_urls = load_crawled_urls(crawled_file)
     for idx, link in enumerate(article_links):
+        if stop_event is not None and stop_event.is_set():
+            logging.info(f"Stop requested, leaving {len(article_links) - idx} articles for the next run")
+            break
         if link in crawled_urls:
             logging.info(f"Skipping already crawled: {link}")
+            metrics.inc("cache_requests_total", cache="crawled_urls", result="hit")
+            metrics.inc("stage_items_total", stage="ingest", result="skipped")
             continue
-        print(f"Progress: {idx+1}/{len(article_links)}")
+        metrics.inc("cache_requests_total", cache="crawled_urls", result="miss")
+        logging.info(f"Progress: {idx+1}/{len(article_links)}")
         try:
-            article_data = crawl_article(link)
-            time.sleep(delay)
+            with metrics.timer("item_duration_seconds", stage="ingest"):
+                article_data = crawl_article(link)
+            pause(delay, stop_event)
             if article_data:
                 save_article_data(article_data, output_file)
                 save_crawled_url(link, crawled_file)
+                crawled_urls.add(link)
+                metrics.inc("stage_items_total", stage="ingest", result="ok")
+            else:
+                metrics.inc("stage_items_total", stage="ingest", result="error")
         except Exception as e:
             logging.exception(f"Failed to collect data from {link}")
+            metrics.inc("stage_items_total", stage="ingest", result="error")
 
-def ingest():
+def ingest(crawled_urls=None, delay=2, stop_event=None):
     journal_list = load_journal_list('data/journals.json')
-    all_article_links = crawl_all_journals(journal_list)
-    crawl_all_articles(all_article_links)
+    all_article_links = crawl_all_journals(journal_list, delay=delay, stop_event=stop_event)
+    crawl_all_articles(all_article_links, delay=delay, crawled_urls=crawled_urls, stop_event=stop_event)
 
 if __name__ == "__main__":
-    ingest()
+    import argparse
+    from layers.profiling import ProfileSession, maybe_profile, add_profile_arguments
+    parser = argparse.ArgumentParser(description="Crawl journals and save article metadata")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    session = ProfileSession(args.profiler, args.profile_dir) if args.profile else None
+    with maybe_profile(session, "ingest"):
+        ingest()
+    if session is not None:
+        print(session.summary_text())
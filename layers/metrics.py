@@ -0,0 +1,200 @@
+"""
+metrics.py
+
+In-process instrumentation for the pipeline: counters and timing histograms with labels, collected over a run.
+Each layer records stage and item timings, HTTP latency and bytes per host, LLM token usage and cache hits here.
+At the end of a run write_report writes a JSON report, appends it to a history file so throughput can be compared
+across runs, and writes a Prometheus text-format file for a node_exporter textfile collector to scrape.
+
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+PREFIX = "csiroinfluencer_"
+# Histogram buckets in seconds, from fast parses up to slow LLM calls
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Keep a bounded sample of raw observations per series for percentiles in the JSON report
+MAX_SAMPLES = 10000
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_started_at = time.time()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def reset():
+    global _started_at
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _started_at = time.time()
+
+def inc(name, value=1, **labels):
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name, value, **labels):
+    with _lock:
+        key = _key(name, labels)
+        hist = _histograms.setdefault(key, {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0, "samples": []})
+        for idx, bound in enumerate(BUCKETS):
+            if value <= bound:
+                hist["buckets"][idx] += 1
+        hist["sum"] += value
+        hist["count"] += 1
+        if len(hist["samples"]) < MAX_SAMPLES:
+            hist["samples"].append(value)
+
+@contextmanager
+def timer(name, **labels):
+    """
+    Record how long the block takes as an observation of `name`, even if it raises.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+# -------------------- Reporting --------------------
+
+def _percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def _summary(hist):
+    return {
+        "count": hist["count"],
+        "sum": round(hist["sum"], 6),
+        "p50": _percentile(hist["samples"], 0.50),
+        "p95": _percentile(hist["samples"], 0.95),
+        "max": max(hist["samples"]) if hist["samples"] else None,
+    }
+
+def _counter_values(name):
+    return [(dict(labels), value) for (n, labels), value in _counters.items() if n == name]
+
+def _histogram_values(name):
+    return [(dict(labels), hist) for (n, labels), hist in _histograms.items() if n == name]
+
+def build_report(extra=None) -> dict:
+    """
+    Summarise the run so far into a JSON-serialisable dict.
+    """
+    with _lock:
+        finished_at = time.time()
+        stages = {}
+        for labels, hist in _histogram_values("stage_duration_seconds"):
+            stages.setdefault(labels["stage"], {})["seconds"] = round(hist["sum"], 3)
+        for labels, value in _counter_values("stage_items_total"):
+            stages.setdefault(labels["stage"], {}).setdefault("items", {})[labels["result"]] = value
+        for labels, hist in _histogram_values("item_duration_seconds"):
+            stages.setdefault(labels["stage"], {})["item_seconds"] = _summary(hist)
+        for stage in stages.values():
+            handled = sum(stage.get("items", {}).values())
+            if stage.get("seconds"):
+                stage["items_per_second"] = round(handled / stage["seconds"], 3)
+
+        http = {}
+        for labels, hist in _histogram_values("http_request_duration_seconds"):
+            http.setdefault(labels["host"], {})["latency_seconds"] = _summary(hist)
+        for labels, value in _counter_values("http_requests_total"):
+            http.setdefault(labels["host"], {}).setdefault("responses", {})[str(labels["status"])] = value
+        for labels, value in _counter_values("http_response_bytes_total"):
+            http.setdefault(labels["host"], {})["bytes"] = value
+
+        llm = {}
+        for labels, value in _counter_values("llm_tokens_total"):
+            llm.setdefault(labels["model"], {})[f"{labels['type']}_tokens"] = value
+
+        caches = {}
+        for labels, value in _counter_values("cache_requests_total"):
+            caches.setdefault(labels["cache"], {"hit": 0, "miss": 0})[labels["result"]] = value
+        for cache in caches.values():
+            total = cache["hit"] + cache["miss"]
+            cache["hit_rate"] = round(cache["hit"] / total, 4) if total else None
+
+        report = {
+            "started_at": datetime.fromtimestamp(_started_at, timezone.utc).isoformat(),
+            "finished_at": datetime.fromtimestamp(finished_at, timezone.utc).isoformat(),
+            "duration_seconds": round(finished_at - _started_at, 3),
+            "stages": stages,
+            "http": http,
+            "llm": llm,
+            "caches": caches,
+        }
+    report.update(extra or {})
+    return report
+
+def _format_labels(labels, **extra):
+    items = list(labels) + sorted(extra.items())
+    if not items:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in items]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+def prometheus_text(const_labels=None) -> str:
+    """
+    Render every counter and histogram in the Prometheus text exposition format.
+
+    :param const_labels: Labels added to every series, e.g. {"worker": "host-123"} so that files written by
+        several processes don't hold clashing series.
+    """
+    def with_const(labels):
+        return tuple(sorted({**dict(labels), **(const_labels or {})}.items()))
+
+    lines = []
+    with _lock:
+        for name in sorted({n for n, _ in _counters}):
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            for (n, labels), value in sorted(_counters.items()):
+                if n == name:
+                    lines.append(f"{PREFIX}{name}{_format_labels(with_const(labels))} {value}")
+        for name in sorted({n for n, _ in _histograms}):
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for (n, labels), hist in sorted(_histograms.items(), key=lambda item: item[0]):
+                if n != name:
+                    continue
+                labels = with_const(labels)
+                # Buckets are already cumulative since observe counts a value in every bound it fits under
+                for bound, count in zip(BUCKETS, hist["buckets"]):
+                    lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, le=bound)} {count}")
+                lines.append(f'{PREFIX}{name}_bucket{_format_labels(labels, le="+Inf")} {hist["count"]}')
+                lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {hist['sum']}")
+                lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {hist['count']}")
+    return "\n".join(lines) + "\n"
+
+def write_report(json_path="data/run_report.json", prom_path="data/metrics.prom", history_path="data/run_reports.jsonl", extra=None, const_labels=None) -> dict:
+    """
+    Write the run report as JSON, append it to the history file and write the Prometheus text file.
+
+    :param const_labels: Labels added to every Prometheus series, see prometheus_text.
+    """
+    report = build_report(extra)
+    for path in [json_path, prom_path, history_path]:
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    if history_path:
+        with open(history_path, "a") as f:
+            f.write(json.dumps(report) + "\n")
+    if prom_path:
+        # Write then rename so a scraper never reads a half-written file
+        tmp_path = f"{prom_path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(prometheus_text(const_labels))
+        os.replace(tmp_path, prom_path)
+    return report
@@ -5,7 +5,7 @@ The code reads articles from a CSV file, processes each abstract, and saves the
 Error handling and logging are included for failed generations.
 """
 
-from openai import OpenAI
+from openai import OpenAI, APIConnectionError, RateLimitError, InternalServerError
 from pydantic import BaseModel
 from typing import List
 import logging
@@ -14,9 +14,14 @@ import os
 import json
 import pandas as pd
 from dotenv import load_dotenv
+from layers.store import PostStore, append_jsonl
+from layers.resilience import call_with_retries
+from layers import metrics
 load_dotenv()
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Retries are handled by call_with_retries so they share backoff, circuit breaking and stats with the other layers
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=120, max_retries=0)
+OPENAI_RETRYABLE = (APIConnectionError, RateLimitError, InternalServerError)
 
 # Set up logging at the top of your file, after imports
 logging.basicConfig(
@@ -32,10 +37,12 @@ class InstaPostDataSchema(BaseModel):
     hashtags: List[str]
     image_prompt: str
 
+MODEL = "gpt-4.5-preview"
+
 def generate_structured_instagram_post(abstract: str):
-    response = client.responses.parse(
+    response = call_with_retries("api.openai.com", lambda: client.responses.parse(
 
-        model="gpt-4.5-preview",
+        model=MODEL,
         # model="o4-mini",
         temperature=0,
         input=[
@@ -62,7 +69,13 @@ def generate_structured_instagram_post(abstract: str):
             },
         ],
         text_format=InstaPostDataSchema
-    )
+    ), retry_on=OPENAI_RETRYABLE)
+
+    usage = getattr(response, "usage", None)
+    for token_type in ["input", "output"]:
+        tokens = getattr(usage, f"{token_type}_tokens", None)
+        if isinstance(tokens, int):
+            metrics.inc("llm_tokens_total", tokens, model=MODEL, type=token_type)
 
     return response.output_parsed
 
@@ -71,6 +84,8 @@ def get_articles() -> list:
     # Get a list of articles we want to make posts for
     
     df = pd.read_csv("data/articles.csv", sep=";", encoding="utf-8")
+    # A queue worker that crashed between saving an article and recording its URL saves it again on retry
+    df = df.drop_duplicates(subset="pdf_url", keep="last")
 
     articles = []
     for _, row in df.iterrows():  # Unpack the tuple into index (_) and row
@@ -78,58 +93,88 @@ def get_articles() -> list:
             "title": row["title"],  # Access row data using string keys
             "abstract": row["abstract"],
             "pdf_url": row["pdf_url"],
+            "doi": row["doi"] if pd.notna(row.get("doi")) else None,
+            "publication_date": row["publication_date"] if pd.notna(row.get("publication_date")) else None,
         })
 
     return articles
 
-def process_articles(articles: list) -> list:
+def process_article(article: dict, store=None) -> dict:
+    # generate the post for a single article and save it
+    # raises if the post could not be generated
+    post = generate_structured_instagram_post(article["abstract"])
+
+    postDict = post.dict()
+    # add the article data to the post
+
+    # add the article link and title to the post
+    postDict["article_link"] = article["pdf_url"]
+    postDict["article_title"] = article["title"]
+    # the DOI is the stable key the post store indexes on
+    if article.get("doi"):
+        postDict["doi"] = article["doi"]
+    if article.get("publication_date"):
+        postDict["publication_date"] = article["publication_date"]
+
+    # save to a file
+    logging.debug(f"Generated post: {postDict}")
+    append_jsonl("data/posts.jsonl", postDict)
+    if store is not None:
+        store.upsert_post(postDict)
+    return postDict
+
+def process_articles(articles: list, store=None, stop_event=None) -> list:
     # generate posts for each article
     # incrementally save to a file
+    # stops before the next article once stop_event is set
     posts = []
     total = len(articles)
     for idx, article in enumerate(articles, 1):
+        if stop_event is not None and stop_event.is_set():
+            logging.info(f"Stop requested, leaving {total - idx + 1} articles for the next run")
+            break
 
-        abstract = article["abstract"]
         try:
             # generate the post
-            post = generate_structured_instagram_post(abstract)
+            with metrics.timer("item_duration_seconds", stage="process"):
+                postDict = process_article(article, store)
         except Exception as e:
+            metrics.inc("stage_items_total", stage="process", result="error")
             logging.error(
                 "Error generating post for article: %s\nError: %s",
                 article['title'],
                 str(e),
                 exc_info=True  # Includes stack trace
             )
-            print(f"Error generating post for article: {article['title']}")
             continue
-        
-        postDict = post.dict()
-        # add the article data to the post
-
-        # add the article link and title to the post
-        postDict["article_link"] = article["pdf_url"]
-        postDict["article_title"] = article["title"]
 
         posts.append(postDict)
-        # save to a file
-        with open("data/posts.jsonl", "a") as f:
-            print(postDict)
-            f.write(json.dumps(postDict) + "\n")
-        
-        # Print progress meter
-        progress = int((idx / total) * 40)
-        bar = "[" + "#" * progress + "-" * (40 - progress) + "]"
-        print(f"Progress: {bar} {idx}/{total} articles processed", end="\r")
+        metrics.inc("stage_items_total", stage="process", result="ok")
+
+        logging.info(f"Progress: {idx}/{total} articles processed")
 
     return posts
 
 
-def process():
+def process(store=None, stop_event=None):
     articles = get_articles()
-    processed_articles = process_articles(articles)
+    if store is not None:
+        return process_articles(articles, store, stop_event=stop_event)
+    with PostStore() as store:
+        processed_articles = process_articles(articles, store, stop_event=stop_event)
     return processed_articles
 
 if __name__ == "__main__":
-    posts = process()
+    import argparse
+    from layers.profiling import ProfileSession, maybe_profile, add_profile_arguments
+    parser = argparse.ArgumentParser(description="Generate posts for the crawled articles")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    session = ProfileSession(args.profiler, args.profile_dir) if args.profile else None
+    with maybe_profile(session, "process"):
+        posts = process()
     for post in posts:
-        print(post)
\ No newline at end of file
+        print(post)
+    if session is not None:
+        print(session.summary_text())
\ No newline at end of file
@@ -0,0 +1,234 @@
+"""
+profiling.py
+
+Opt-in profiling for pipeline stages, switched on with --profile on orchestration.py or a layer's __main__.
+Each profiled stage runs under either cProfile or a low-overhead sampling profiler, with tracemalloc tracking
+peak memory. Artefacts for a run go to a dated directory under profiles/:
+
+- <stage>.prof           cProfile stats, for snakeviz or pstats (cprofile mode)
+- <stage>.folded         folded stacks, for flamegraph.pl or speedscope (sample mode)
+- <stage>.txt            top hotspots by cumulative time and top allocation sites
+- summary.json / .txt    every profiled stage ranked by its top cumulative hotspots
+
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+PROFILERS = ["cprofile", "sample"]
+TOP_N = 20
+
+
+class SamplingProfiler:
+    """
+    Samples the profiled thread's stack every `interval` seconds from a background thread.
+
+    Much cheaper than cProfile for long network-bound stages, and its cumulative counts show where
+    wall time goes including time spent waiting on sockets.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.elapsed = 0.0
+        self._started = None
+        self._target = None
+        self._base_frames = []
+        self._base_ids = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._target = threading.get_ident()
+        # The frames already on the stack (the with block's caller, the CLI, pytest...) are in every sample, so they'd
+        # all show a 100% share and crowd out the real hotspots. Samples are cut at them. Holding references keeps the
+        # frames alive, so their ids can't be reused by frames inside the profiled block.
+        frame = sys._getframe()
+        self._base_frames = []
+        while frame is not None:
+            self._base_frames.append(frame)
+            frame = frame.f_back
+        self._base_ids = {id(frame) for frame in self._base_frames}
+        self._started = time.perf_counter()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self._started
+        self._base_frames = []
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and id(frame) not in self._base_ids:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            # Time spent directly in the with block, outside any call it makes
+            self.stacks[tuple(reversed(stack)) or ("<profiled block>",)] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def hotspots(self, top_n=TOP_N) -> list:
+        """
+        Rank functions by the share of samples they appear anywhere on the stack in.
+
+        Seconds are estimated from each function's share of the samples and the profiled wall time,
+        since samples land less often than `interval` when the profiled thread holds the GIL.
+        """
+        seconds_per_sample = self.elapsed / self.samples if self.samples else 0
+        cumulative = Counter()
+        own = Counter()
+        for stack, count in self.stacks.items():
+            for func in set(stack):
+                cumulative[func] += count
+            own[stack[-1]] += count
+        return [
+            {
+                "function": func,
+                "cumulative_seconds": round(count * seconds_per_sample, 4),
+                "own_seconds": round(own[func] * seconds_per_sample, 4),
+                "share": round(count / self.samples, 4) if self.samples else 0,
+            }
+            for func, count in cumulative.most_common(top_n)
+        ]
+
+
+def _cprofile_hotspots(profiler, top_n=TOP_N) -> list:
+    stats = pstats.Stats(profiler)
+    stats.sort_stats("cumulative")
+    hotspots = []
+    for func in stats.fcn_list[:top_n]:
+        primitive_calls, total_calls, own_time, cumulative_time, _ = stats.stats[func]
+        filename, line, name = func
+        hotspots.append({
+            "function": f"{name} ({os.path.basename(filename)}:{line})",
+            "cumulative_seconds": round(cumulative_time, 4),
+            "own_seconds": round(own_time, 4),
+            "calls": total_calls,
+        })
+    return hotspots
+
+
+class ProfileSession:
+    def __init__(self, mode="cprofile", output_root="profiles", top_n=TOP_N):
+        if mode not in PROFILERS:
+            raise ValueError(f"Unknown profiler '{mode}'. Choose from: {', '.join(PROFILERS)}")
+        self.mode = mode
+        self.top_n = top_n
+        self.output_dir = os.path.join(output_root, datetime.now().strftime("%Y-%m-%d_%H%M%S"))
+        self.results = {}
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Profile the block as stage `name` and write its artefacts when it finishes, even if it raises.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        profiler = cProfile.Profile() if self.mode == "cprofile" else SamplingProfiler()
+        started = time.perf_counter()
+        if self.mode == "cprofile":
+            profiler.enable()
+        else:
+            profiler.start()
+        try:
+            yield
+        finally:
+            if self.mode == "cprofile":
+                profiler.disable()
+            else:
+                profiler.stop()
+            wall_seconds = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            allocations = tracemalloc.take_snapshot().statistics("lineno")[:10]
+            if started_tracing:
+                tracemalloc.stop()
+            self._write_stage(name, profiler, wall_seconds, peak, allocations)
+
+    def _write_stage(self, name, profiler, wall_seconds, peak, allocations):
+        base = os.path.join(self.output_dir, name)
+        if self.mode == "cprofile":
+            profiler.dump_stats(f"{base}.prof")
+            hotspots = _cprofile_hotspots(profiler, self.top_n)
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(self.top_n)
+            details = report.getvalue()
+        else:
+            with open(f"{base}.folded", "w") as f:
+                f.write(profiler.folded())
+            hotspots = profiler.hotspots(self.top_n)
+            details = f"{profiler.samples} samples every {profiler.interval * 1000:.0f}ms\n"
+
+        with open(f"{base}.txt", "w") as f:
+            f.write(f"Stage: {name}\nWall time: {wall_seconds:.3f}s\nPeak traced memory: {peak / 1024 / 1024:.2f} MiB\n\n")
+            f.write(details)
+            f.write("\nTop allocation sites:\n")
+            for stat in allocations:
+                f.write(f"{stat}\n")
+
+        self.results[name] = {
+            "profiler": self.mode,
+            "wall_seconds": round(wall_seconds, 3),
+            "peak_memory_bytes": peak,
+            "hotspots": hotspots,
+        }
+        self.write_summary()
+
+    def write_summary(self):
+        with open(os.path.join(self.output_dir, "summary.json"), "w") as f:
+            json.dump(self.results, f, indent=2)
+        with open(os.path.join(self.output_dir, "summary.txt"), "w") as f:
+            f.write(self.summary_text())
+
+    def summary_text(self, top_n=10) -> str:
+        lines = []
+        for name, result in self.results.items():
+            lines.append(f"== {name}: {result['wall_seconds']}s wall, {result['peak_memory_bytes'] / 1024 / 1024:.2f} MiB peak ==")
+            for rank, hotspot in enumerate(result["hotspots"][:top_n], 1):
+                lines.append(f"{rank:>3}. {hotspot['cumulative_seconds']:>10.3f}s cum  {hotspot['own_seconds']:>10.3f}s own  {hotspot['function']}")
+            lines.append("")
+        return "\n".join(lines)
+
+
+def maybe_profile(session, name, stages=None):
+    """
+    Return session.stage(name) if profiling is on and `name` is one of the chosen stages, otherwise a no-op.
+    """
+    if session is None or (stages and name not in stages):
+        return nullcontext()
+    return session.stage(name)
+
+def add_profile_arguments(parser, stages=None):
+    """
+    Add the --profile and --profiler options shared by orchestration.py and the layers' __main__.
+    """
+    if stages:
+        parser.add_argument("--profile", nargs="*", choices=stages, default=None,
+                            help="Profile the given stages (all stages if none are given)")
+    else:
+        parser.add_argument("--profile", action="store_true", help="Profile this stage")
+    parser.add_argument("--profiler", choices=PROFILERS, default="cprofile", help="cProfile or the sampling profiler")
+    parser.add_argument("--profile-dir", default="profiles", help="Directory the dated profile folder is created in")
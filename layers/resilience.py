@@ -0,0 +1,216 @@
+"""
+resilience.py
+
+Shared retry, backoff and circuit breaking for every outbound call the pipeline makes.
+Requests get a connect/read timeout and are retried on connection errors, timeouts, 429 and 5xx responses with
+jittered exponential backoff, honouring any Retry-After header. Each host has a circuit breaker that opens after
+repeated failures so that during an outage calls fail fast instead of each waiting out its own timeout.
+Call, retry and failure counts per host are kept for the run and included in the metrics run report.
+
+"""
+
+import time
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+
+from layers import metrics
+
+DEFAULT_TIMEOUT = (5, 30)  # (connect, read) seconds
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+# -------------------- Circuit Breaker --------------------
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls until `reset_timeout`
+    seconds have passed, then lets a single trial call through to decide whether to close again.
+    """
+
+    def __init__(self, host, failure_threshold=5, reset_timeout=60):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_timeout or self.trial_in_flight:
+                _count(self.host, "short_circuits")
+                raise CircuitOpenError(f"Circuit open for {self.host}, failing fast")
+            # Half open, let this call through as the trial
+            self.trial_in_flight = True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logging.error(f"Circuit opened for {self.host} after {self.failures} consecutive failures")
+                    _count(self.host, "circuit_opens")
+                self.opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(host) -> CircuitBreaker:
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
+
+# -------------------- Stats --------------------
+
+_stats = {}
+_stats_lock = threading.Lock()
+STAT_FIELDS = ["calls", "retries", "failures", "short_circuits", "circuit_opens"]
+
+def _count(host, field, n=1):
+    with _stats_lock:
+        host_stats = _stats.setdefault(host, dict.fromkeys(STAT_FIELDS, 0))
+        host_stats[field] += n
+    metrics.inc(f"outbound_{field}_total", n, host=host)
+
+def get_stats() -> dict:
+    with _stats_lock:
+        return {host: dict(counts) for host, counts in _stats.items()}
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+# -------------------- Retry --------------------
+
+def parse_retry_after(value):
+    """
+    Return the delay in seconds from a Retry-After header (either seconds or an HTTP date), or None.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, base=1.0, max_delay=60.0, retry_after=None):
+    # Full jitter keeps many workers from retrying in lockstep
+    if retry_after is not None:
+        return min(retry_after, max_delay)
+    return random.uniform(0, min(max_delay, base * 2 ** attempt))
+
+def _retry_after_from(obj):
+    headers = getattr(obj, "headers", None) or getattr(getattr(obj, "response", None), "headers", None)
+    try:
+        return parse_retry_after(headers.get("Retry-After")) if headers else None
+    except AttributeError:
+        return None
+
+def call_with_retries(host, func, retry_on=(), retries=3, base_delay=1.0, max_delay=60.0):
+    """
+    Call `func()` through the host's circuit breaker, retrying on the given exception types
+    (or any exception carrying a retryable status code) with jittered exponential backoff.
+
+    Exceptions that are not retryable are raised straight away and do not count against the circuit.
+    """
+    breaker = get_breaker(host)
+    for attempt in range(retries + 1):
+        breaker.before_call()
+        _count(host, "calls")
+        try:
+            with metrics.timer("http_request_duration_seconds", host=host):
+                result = func()
+        except Exception as e:
+            status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+            if not isinstance(e, retry_on) and status not in RETRY_STATUSES:
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            if attempt == retries:
+                _count(host, "failures")
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay, _retry_after_from(e))
+            logging.warning(f"Call to {host} failed ({e}), retry {attempt + 1}/{retries} in {delay:.1f}s")
+        except BaseException:
+            # e.g. KeyboardInterrupt: still settle the breaker so a half-open trial is never left in flight
+            breaker.record_failure()
+            raise
+        else:
+            breaker.record_success()
+            return result
+        _count(host, "retries")
+        time.sleep(delay)
+
+def resilient_get(url, timeout=DEFAULT_TIMEOUT, retries=3, base_delay=1.0, max_delay=60.0, **kwargs) -> requests.Response:
+    """
+    requests.get with a timeout, retries on connection errors, timeouts, 429 and 5xx, and a per-host circuit breaker.
+
+    Other status codes are returned as-is so callers keep their own status handling. If every attempt
+    gets a retryable status, the last response is returned.
+    """
+    host = urlparse(url).netloc
+    breaker = get_breaker(host)
+    response = None
+    for attempt in range(retries + 1):
+        breaker.before_call()
+        _count(host, "calls")
+        try:
+            with metrics.timer("http_request_duration_seconds", host=host):
+                response = requests.get(url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            metrics.inc("http_requests_total", host=host, status="error")
+            breaker.record_failure()
+            if attempt == retries:
+                _count(host, "failures")
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            logging.warning(f"GET {url} failed ({e}), retry {attempt + 1}/{retries} in {delay:.1f}s")
+        except BaseException:
+            # Other request errors (ChunkedEncodingError, TooManyRedirects, InvalidURL...) aren't retried, but they
+            # still count against the circuit so a half-open trial is never left in flight
+            metrics.inc("http_requests_total", host=host, status="error")
+            breaker.record_failure()
+            _count(host, "failures")
+            raise
+        else:
+            metrics.inc("http_requests_total", host=host, status=response.status_code)
+            if isinstance(response.content, (bytes, bytearray)):
+                metrics.inc("http_response_bytes_total", len(response.content), host=host)
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            if attempt == retries:
+                _count(host, "failures")
+                return response
+            delay = backoff_delay(attempt, base_delay, max_delay, _retry_after_from(response))
+            logging.warning(f"GET {url} returned {response.status_code}, retry {attempt + 1}/{retries} in {delay:.1f}s")
+        _count(host, "retries")
+        time.sleep(delay)
+    return response
@@ -0,0 +1,369 @@
+"""
+store.py
+
+This layer keeps an indexed SQLite store of generated posts and their rendered images.
+Posts are keyed by a stable article ID (the DOI where we have one) instead of a truncated title,
+so lookups by article, DOI or publication date go through an index rather than a scan of the JSONL files.
+Rendered images are saved under content-hashed, sharded paths and the append-only JSONL files can be compacted.
+
+"""
+
+import os
+import csv
+import json
+import fcntl
+import sqlite3
+import hashlib
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+# Posts rendered before the store existed, imported once into each new database
+LEGACY_POSTS_FILE = "output/posts_with_images.jsonl"
+# Crawled articles, used to find the DOI of legacy posts, which were saved without one
+ARTICLES_FILE = "data/articles.csv"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    article_id TEXT PRIMARY KEY,
+    doi TEXT,
+    title TEXT,
+    publication_date TEXT,
+    data TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_posts_doi ON posts(doi);
+CREATE INDEX IF NOT EXISTS idx_posts_publication_date ON posts(publication_date);
+
+CREATE TABLE IF NOT EXISTS assets (
+    article_id TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    image_path TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_assets_content_hash ON assets(content_hash);
+
+CREATE TABLE IF NOT EXISTS render_failures (
+    article_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    error TEXT,
+    attempts INTEGER NOT NULL,
+    failed_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# -------------------- Keys and Paths --------------------
+
+def article_id(record: dict) -> str:
+    """
+    Return a stable ID for an article or post record.
+
+    Prefers the DOI, then the article link, and only falls back to a hash of the full title.
+    """
+    doi = record.get("doi")
+    if isinstance(doi, str) and doi.strip():
+        return doi.strip().lower()
+    link = record.get("article_link") or record.get("pdf_url")
+    if isinstance(link, str) and link.strip():
+        return link.strip().rstrip("/")
+    title = record.get("article_title") or record.get("title") or ""
+    return "title:" + hashlib.sha1(title.encode("utf-8")).hexdigest()
+
+def normalise_date(value) -> Optional[str]:
+    # The journal pages give dates as 2025/05/01, store them as ISO so they sort and range correctly
+    if not isinstance(value, str) or not value.strip():
+        return None
+    return value.strip().replace("/", "-")
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def sharded_path(digest: str, root="output/images", ext="jpg") -> str:
+    """
+    Return a path like output/images/ab/cd/abcd....jpg for a content hash.
+    """
+    return os.path.join(root, digest[:2], digest[2:4], f"{digest}.{ext}")
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+# -------------------- Store --------------------
+
+class PostStore:
+    def __init__(self, db_path="data/store.db", legacy_posts_file=LEGACY_POSTS_FILE, articles_file=ARTICLES_FILE):
+        """
+        :param legacy_posts_file: JSONL of posts rendered before the store existed, imported the first time
+            this database is opened so their images aren't rendered again. None to skip.
+        :param articles_file: articles.csv to look the legacy posts' DOIs up in.
+        """
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        if legacy_posts_file:
+            self.import_legacy_posts(legacy_posts_file, articles_file)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- Posts ----------
+
+    def upsert_post(self, post: dict) -> str:
+        aid = article_id(post)
+        self.conn.execute(
+            "INSERT INTO posts (article_id, doi, title, publication_date, data, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(article_id) DO UPDATE SET doi=excluded.doi, title=excluded.title, "
+            "publication_date=excluded.publication_date, data=excluded.data, updated_at=excluded.updated_at",
+            (
+                aid,
+                (post.get("doi") or "").lower() or None,
+                post.get("article_title"),
+                normalise_date(post.get("publication_date")),
+                json.dumps(post),
+                _now(),
+            ),
+        )
+        self.conn.commit()
+        return aid
+
+    def get_post(self, aid: str) -> Optional[dict]:
+        row = self.conn.execute("SELECT data FROM posts WHERE article_id = ?", (aid,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def get_post_by_doi(self, doi: str) -> Optional[dict]:
+        row = self.conn.execute("SELECT data FROM posts WHERE doi = ?", (doi.lower(),)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def posts_between(self, start: str, end: str) -> list:
+        """
+        Return posts published between two dates (inclusive), oldest first.
+        """
+        rows = self.conn.execute(
+            "SELECT data FROM posts WHERE publication_date BETWEEN ? AND ? ORDER BY publication_date",
+            (normalise_date(start), normalise_date(end)),
+        )
+        return [json.loads(row["data"]) for row in rows]
+
+    def count_posts(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM posts").fetchone()[0]
+
+    # ---------- Assets ----------
+
+    def get_asset(self, aid: str) -> Optional[dict]:
+        row = self.conn.execute(
+            "SELECT article_id, content_hash, image_path, created_at FROM assets WHERE article_id = ?", (aid,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def add_asset(self, aid: str, digest: str, image_path: str):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO assets (article_id, content_hash, image_path, created_at) VALUES (?, ?, ?, ?)",
+            (aid, digest, image_path, _now()),
+        )
+        self.conn.commit()
+
+    def save_image(self, aid: str, data: bytes, root="output/images", ext="jpg") -> str:
+        """
+        Write encoded image bytes to their content-hashed path and record them as the article's asset.
+
+        :return: Path the image was written to.
+        """
+        digest = content_hash(data)
+        path = sharded_path(digest, root, ext)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        self.add_asset(aid, digest, path)
+        return path
+
+    # ---------- Render Failures ----------
+
+    def record_render_failure(self, post: dict, error: str) -> int:
+        """
+        Remember a post whose image failed to render so it is retried without rescanning posts.jsonl.
+
+        :return: Number of times rendering this post has now failed.
+        """
+        aid = article_id(post)
+        self.conn.execute(
+            "INSERT INTO render_failures (article_id, data, error, attempts, failed_at) VALUES (?, ?, ?, 1, ?) "
+            "ON CONFLICT(article_id) DO UPDATE SET data=excluded.data, error=excluded.error, "
+            "attempts=attempts + 1, failed_at=excluded.failed_at",
+            (aid, json.dumps(post), error, _now()),
+        )
+        self.conn.commit()
+        return self.conn.execute("SELECT attempts FROM render_failures WHERE article_id = ?", (aid,)).fetchone()[0]
+
+    def clear_render_failure(self, aid: str):
+        self.conn.execute("DELETE FROM render_failures WHERE article_id = ?", (aid,))
+        self.conn.commit()
+
+    def render_failures(self, max_attempts=None) -> list:
+        """
+        Return the posts awaiting a render retry, oldest failure first.
+
+        :param max_attempts: Leave out posts that have already failed this many times.
+        """
+        rows = self.conn.execute(
+            "SELECT data FROM render_failures WHERE ? IS NULL OR attempts < ? ORDER BY failed_at",
+            (max_attempts, max_attempts),
+        )
+        return [json.loads(row["data"]) for row in rows]
+
+    # ---------- Meta ----------
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def set_meta(self, key: str, value: str):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+        self.conn.commit()
+
+    # ---------- Import ----------
+
+    def import_legacy_posts(self, filepath=LEGACY_POSTS_FILE, articles_file=ARTICLES_FILE) -> int:
+        """
+        Import posts rendered under the old title-keyed scheme, once per database.
+
+        Legacy posts were saved without a DOI, but processing now keys each post by its DOI. So each legacy post's
+        DOI is looked up in articles.csv by its article link, and the image is registered under the same key the
+        reprocessed post will have.
+
+        Whether the import has run is recorded in the meta table, not inferred from the post count,
+        since processing fills the posts table before any image is rendered.
+
+        :return: Number of records imported (0 if the import already ran).
+        """
+        # Versioned, since an earlier import registered legacy images under their article link instead
+        if self.get_meta("legacy_posts_imported_by_doi"):
+            return 0
+        count = self.import_jsonl(filepath, dois=load_dois(articles_file))
+        self.set_meta("legacy_posts_imported_by_doi", _now())
+        return count
+
+    def import_jsonl(self, filepath: str, dois=None) -> int:
+        """
+        Load posts from a JSONL file into the store, registering any existing image_path as an asset.
+
+        :param dois: {article link: DOI} to fill in the DOI of posts saved without one.
+        :return: Number of records imported.
+        """
+        if not os.path.exists(filepath):
+            return 0
+        count = 0
+        with open(filepath, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                post = json.loads(line)
+                if not post.get("doi") and (dois or {}).get(post.get("article_link")):
+                    post["doi"] = dois[post["article_link"]]
+                aid = self.upsert_post(post)
+                image_path = post.get("image_path")
+                if image_path and os.path.exists(image_path):
+                    with open(image_path, "rb") as img_f:
+                        self.add_asset(aid, content_hash(img_f.read()), image_path)
+                count += 1
+        logging.info(f"Imported {count} posts from {filepath}")
+        return count
+
+def load_dois(articles_file=ARTICLES_FILE) -> dict:
+    """
+    Return {pdf_url: DOI} for the crawled articles that have a DOI.
+    """
+    if not articles_file or not os.path.exists(articles_file):
+        return {}
+    with open(articles_file, "r", encoding="utf-8", newline="") as f:
+        return {row["pdf_url"]: row["doi"] for row in csv.DictReader(f, delimiter=";") if row.get("pdf_url") and row.get("doi")}
+
+# -------------------- Append-only Files --------------------
+
+@contextmanager
+def jsonl_lock(filepath: str, exclusive=False):
+    """
+    Lock an append-only JSONL file. Appenders share the lock and compaction takes it exclusively,
+    so no record is appended between compaction reading the file and replacing it.
+
+    The lock is held on a sidecar file, since compaction replaces the JSONL file itself.
+    """
+    lock_path = f"{filepath}.lock"
+    if os.path.dirname(lock_path):
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def append_jsonl(filepath: str, record: dict):
+    with jsonl_lock(filepath), open(filepath, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+# -------------------- Compaction --------------------
+
+def compact_jsonl(filepath: str, key=article_id) -> tuple[int, int]:
+    """
+    Rewrite an append-only JSONL file keeping only the latest record for each key.
+
+    Records keep the position of their first appearance. The file is replaced atomically.
+
+    :return: (records before, records after)
+    """
+    if not os.path.exists(filepath):
+        return 0, 0
+    latest = {}
+    before = 0
+    with jsonl_lock(filepath, exclusive=True):
+        with open(filepath, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                latest[key(record)] = record
+                before += 1
+
+        tmp_path = f"{filepath}.tmp"
+        with open(tmp_path, "w") as f:
+            for record in latest.values():
+                f.write(json.dumps(record) + "\n")
+        os.replace(tmp_path, filepath)
+    logging.info(f"Compacted {filepath} from {before} to {len(latest)} records")
+    return before, len(latest)
+
+if __name__ == "__main__":
+    import sys
+    from orchestration import pipeline_lock, PipelineLocked
+    # Hold the pipeline lock so a cron run or the daemon can't read posts.jsonl through a checkpoint
+    # while it is rewritten. Queue workers don't take this lock, their appends wait on jsonl_lock instead.
+    try:
+        with pipeline_lock():
+            for path in ["data/posts.jsonl", LEGACY_POSTS_FILE]:
+                before, after = compact_jsonl(path)
+                print(f"Compacted {path}: {before} -> {after} records")
+            # Byte offsets into posts.jsonl are meaningless after a rewrite, so rescan it next run
+            if os.path.exists("output/posts_checkpoint.txt"):
+                os.remove("output/posts_checkpoint.txt")
+    except PipelineLocked as e:
+        print(f"{e}, try again once it finishes")
+        sys.exit(1)
@@ -0,0 +1,218 @@
+"""
+workqueue.py
+
+A small lease-based work queue stored in SQLite, so several worker processes can split the pipeline between them.
+Each task is one article (or journal) at one stage. A worker leases a task for a fixed time and keeps extending the
+lease from a heartbeat thread while it works; if it crashes the heartbeat stops, the lease expires and another worker
+picks the task up. Failed tasks are retried with exponential backoff up to a maximum number of attempts.
+Tasks are unique per (stage, key), so enqueueing the same article twice does not duplicate work.
+
+Workers on several hosts can share the queue through a shared filesystem as long as it supports POSIX file locks.
+The queue uses SQLite's default rollback journal rather than WAL for that reason, because WAL does not work over
+network filesystems.
+
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    stage TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    last_error TEXT,
+    updated_at REAL NOT NULL,
+    UNIQUE (stage, key)
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_ready ON tasks(status, stage, available_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_lease ON tasks(status, lease_expires);
+"""
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+class TaskQueue:
+    def __init__(self, db_path="data/queue.db", lease_seconds=300, max_attempts=5, base_retry_delay=60, max_retry_delay=3600):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.base_retry_delay = base_retry_delay
+        self.max_retry_delay = max_retry_delay
+        # Autocommit mode so leasing can open its own IMMEDIATE transaction
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def enqueue(self, stage: str, key: str, payload=None, requeue=False) -> bool:
+        """
+        Add a task unless one already exists for (stage, key).
+
+        :param requeue: Reset an existing finished or failed task to pending, e.g. to crawl a journal again.
+        :return: True if a task was added or requeued.
+        """
+        now = time.time()
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO tasks (stage, key, payload, available_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (stage, key, json.dumps(payload), now, now),
+        )
+        if cursor.rowcount:
+            return True
+        if requeue:
+            cursor = self.conn.execute(
+                "UPDATE tasks SET status = ?, attempts = 0, payload = ?, available_at = ?, last_error = NULL, updated_at = ? "
+                "WHERE stage = ? AND key = ? AND status IN (?, ?)",
+                (PENDING, json.dumps(payload), now, now, stage, key, DONE, FAILED),
+            )
+            return bool(cursor.rowcount)
+        return False
+
+    def lease(self, worker_id: str, stages=None) -> Optional[dict]:
+        """
+        Lease the next ready task, or a task whose previous lease expired.
+
+        :param stages: Only lease tasks from these stages. Leases from any stage if None.
+        :return: Task dict with its payload decoded, or None if nothing is ready.
+        """
+        now = time.time()
+        stage_filter = ""
+        params = []
+        if stages:
+            stage_filter = f"AND stage IN ({', '.join('?' for _ in stages)})"
+            params = list(stages)
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Tasks whose worker died on their final attempt are given up on rather than retried forever
+            self.conn.execute(
+                "UPDATE tasks SET status = ?, last_error = 'lease expired', lease_owner = NULL, updated_at = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                (FAILED, now, LEASED, now, self.max_attempts),
+            )
+            row = self.conn.execute(
+                "SELECT * FROM tasks WHERE ((status = ? AND available_at <= ?) OR (status = ? AND lease_expires < ?)) "
+                f"{stage_filter} ORDER BY available_at, task_id LIMIT 1",
+                [PENDING, now, LEASED, now] + params,
+            ).fetchone()
+            if row is None:
+                self.conn.execute("COMMIT")
+                return None
+            if row["status"] == LEASED:
+                logging.warning(f"Lease on {row['stage']} task {row['key']} held by {row['lease_owner']} expired, re-leasing")
+            self.conn.execute(
+                "UPDATE tasks SET status = ?, attempts = attempts + 1, lease_owner = ?, lease_expires = ?, updated_at = ? "
+                "WHERE task_id = ?",
+                (LEASED, worker_id, now + self.lease_seconds, now, row["task_id"]),
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        task = dict(row)
+        task["payload"] = json.loads(task["payload"]) if task["payload"] else None
+        task["attempts"] += 1
+        task["lease_owner"] = worker_id
+        return task
+
+    def complete(self, task: dict) -> bool:
+        """
+        Mark a leased task as done. Returns False if the lease was lost to another worker.
+        """
+        cursor = self.conn.execute(
+            "UPDATE tasks SET status = ?, lease_owner = NULL, lease_expires = NULL, last_error = NULL, updated_at = ? "
+            "WHERE task_id = ? AND status = ? AND lease_owner = ?",
+            (DONE, time.time(), task["task_id"], LEASED, task["lease_owner"]),
+        )
+        return bool(cursor.rowcount)
+
+    def fail(self, task: dict, error: str) -> bool:
+        """
+        Release a leased task after an error, scheduling a retry with exponential backoff
+        or marking it failed once it has used all of its attempts.
+        """
+        now = time.time()
+        if task["attempts"] >= self.max_attempts:
+            status, available_at = FAILED, now
+        else:
+            delay = min(self.base_retry_delay * 2 ** (task["attempts"] - 1), self.max_retry_delay)
+            status, available_at = PENDING, now + delay
+        cursor = self.conn.execute(
+            "UPDATE tasks SET status = ?, available_at = ?, lease_owner = NULL, lease_expires = NULL, last_error = ?, updated_at = ? "
+            "WHERE task_id = ? AND status = ? AND lease_owner = ?",
+            (status, available_at, error, now, task["task_id"], LEASED, task["lease_owner"]),
+        )
+        return bool(cursor.rowcount)
+
+    def extend_lease(self, task: dict) -> bool:
+        """
+        Push a long-running task's lease out by another lease period.
+        """
+        cursor = self.conn.execute(
+            "UPDATE tasks SET lease_expires = ?, updated_at = ? WHERE task_id = ? AND status = ? AND lease_owner = ?",
+            (time.time() + self.lease_seconds, time.time(), task["task_id"], LEASED, task["lease_owner"]),
+        )
+        return bool(cursor.rowcount)
+
+    @contextmanager
+    def heartbeat(self, task: dict, interval=None):
+        """
+        Keep extending the task's lease from a background thread while the block runs, so a task that
+        takes longer than one lease period (e.g. an LLM call retried with backoff) is never re-leased
+        to a second worker while the first is still working on it.
+
+        :param interval: Seconds between extensions, a third of the lease period by default.
+        """
+        interval = interval or self.lease_seconds / 3
+        stop = threading.Event()
+
+        def beat():
+            # SQLite connections can't be shared between threads, so the heartbeat opens its own
+            with TaskQueue(self.db_path, self.lease_seconds) as queue:
+                while not stop.wait(interval):
+                    if not queue.extend_lease(task):
+                        logging.warning(f"Lost the lease on {task['stage']} task {task['key']}")
+                        return
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def counts(self) -> dict:
+        """
+        Return the number of tasks per stage and status, e.g. {'render': {'pending': 3, 'done': 10}}.
+        """
+        counts = {}
+        for row in self.conn.execute("SELECT stage, status, COUNT(*) AS n FROM tasks GROUP BY stage, status"):
+            counts.setdefault(row["stage"], {})[row["status"]] = row["n"]
+        return counts
@@ -1,18 +1,235 @@
-from layers.ingestion import ingest
-from layers.processing import process
-from layers.contentGeneration import generate_images
+import os
+import re
+import time
+import fcntl
+import logging
+import socket
+import argparse
+import multiprocessing
+from contextlib import contextmanager
 
-def run_pipeline():
-    print("Starting pipeline execution...")
-    ingest()
+from layers.ingestion import ingest, crawl_journal, crawl_article, save_article_data, save_crawled_url, load_crawled_urls, load_journal_list
+from layers.processing import process, process_article
+from layers.contentGeneration import generate_images, render_post
+from layers.store import PostStore, article_id
+from layers.workqueue import TaskQueue
+from layers.resilience import reset_stats, get_stats
+from layers import metrics
+from layers.profiling import ProfileSession, maybe_profile, add_profile_arguments
+
+LOCK_FILE = "data/pipeline.lock"
+QUEUE_STAGES = ["crawl_journal", "crawl_article", "process", "render"]
+PIPELINE_STAGES = ["ingest", "process", "generate_images"]
+
+
+class PipelineLocked(Exception):
+    pass
+
+
+@contextmanager
+def pipeline_lock(path=LOCK_FILE):
+    """
+    Hold an exclusive lock on `path` so cron runs and the daemon never overlap.
+
+    Raises PipelineLocked straight away if another process holds the lock. The OS drops
+    the lock if the holder dies, so a crashed run never leaves a stale lock behind.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a+") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise PipelineLocked(f"Another pipeline run holds {path}")
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def configure_console_logging(level="INFO"):
+    """
+    Send log records at `level` and above to stderr as well as the layers' log files.
+    """
+    handler = logging.StreamHandler()
+    handler.setLevel(level)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s'))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(min(root.level or logging.WARNING, handler.level))
+
+def start_run():
+    metrics.reset()
+    reset_stats()
+
+def finish_run(extra=None, **report_kwargs):
+    """
+    Write the run report. `report_kwargs` go to metrics.write_report, e.g. per-worker paths.
+    """
+    report = metrics.write_report(extra={"outbound": get_stats(), **(extra or {})}, **report_kwargs)
+    for stage, summary in report["stages"].items():
+        logging.info(f"Stage {stage}: {summary.get('seconds')}s, items {summary.get('items', {})}, {summary.get('items_per_second')} items/s")
+    return report
+
+def run_pipeline(profile_session=None, profile_stages=None):
+    """
+    Run every stage once. If a profile session is given, the stages in `profile_stages`
+    (all of them if empty) are profiled.
+    """
+    start_run()
+    logging.info("Starting pipeline execution...")
+    try:
+        with metrics.timer("stage_duration_seconds", stage="ingest"), maybe_profile(profile_session, "ingest", profile_stages):
+            ingest()
+
+        logging.info("Ingestion completed. Processing articles...")
+        with metrics.timer("stage_duration_seconds", stage="process"), maybe_profile(profile_session, "process", profile_stages):
+            process()
+
+        logging.info("Processing completed. Generating images...")
+        with metrics.timer("stage_duration_seconds", stage="generate_images"), maybe_profile(profile_session, "generate_images", profile_stages):
+            generate_images()
+    finally:
+        finish_run()
+        if profile_session is not None and profile_session.results:
+            logging.info(f"Profiles written to {profile_session.output_dir}\n{profile_session.summary_text()}")
+
+
+# -------------------- Work Queue Mode --------------------
+
+def seed_queue(queue):
+    """
+    Queue a crawl of every journal. Each finished stage queues the next one for its articles.
+    """
+    journals = load_journal_list('data/journals.json')
+    for journal in journals:
+        queue.enqueue("crawl_journal", journal, {"url": journal}, requeue=True)
+    return len(journals)
+
+def handle_task(task, queue, store, delay=2):
+    stage, payload = task["stage"], task["payload"]
+    if stage == "crawl_journal":
+        crawled_urls = load_crawled_urls()
+        for link in crawl_journal(payload["url"]):
+            if link not in crawled_urls:
+                queue.enqueue("crawl_article", link, {"url": link})
+        time.sleep(delay)
+    elif stage == "crawl_article":
+        article_data = crawl_article(payload["url"])
+        time.sleep(delay)
+        if not article_data:
+            raise ValueError(f"No article metadata for {payload['url']}")
+        # A retry after a crash past this point must not append the article again
+        if payload["url"] not in load_crawled_urls():
+            save_article_data(article_data)
+            save_crawled_url(payload["url"])
+        article = {field: article_data.get(field) for field in ["title", "abstract", "pdf_url", "doi", "publication_date"]}
+        queue.enqueue("process", article_id(article), article)
+    elif stage == "process":
+        post = process_article(payload, store)
+        queue.enqueue("render", article_id(post), post)
+    elif stage == "render":
+        if not store.get_asset(article_id(payload)):
+            render_post(payload, store)
+    else:
+        raise ValueError(f"Unknown stage: {stage}")
+
+def worker_report_paths(worker_id, report_dir="data") -> dict:
+    """
+    Return the write_report arguments for a worker: its own JSON report and Prometheus file, so that
+    several workers never overwrite each other, plus the shared history file.
+    """
+    tag = re.sub(r"[^A-Za-z0-9_.-]", "-", worker_id)
+    return {
+        "json_path": os.path.join(report_dir, f"run_report-{tag}.json"),
+        "prom_path": os.path.join(report_dir, f"metrics-{tag}.prom"),
+        "history_path": os.path.join(report_dir, "run_reports.jsonl"),
+        "const_labels": {"worker": worker_id},
+    }
+
+def run_worker(stages=None, until_empty=False, poll_interval=5, queue_path="data/queue.db", report_every=100, report_interval=300,
+               worker_id=None, report_dir="data"):
+    """
+    Lease and run tasks from the queue until it is empty (if until_empty) or forever.
+
+    A worker has no natural end of run, so it writes a run report (and starts a fresh metrics window)
+    every `report_every` tasks or `report_interval` seconds, whichever comes first, and when it stops.
+    Each worker writes its own report files, see worker_report_paths.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    report_paths = worker_report_paths(worker_id, report_dir)
+    start_run()
+    tasks_since_report, last_report = 0, time.monotonic()
+    try:
+        with TaskQueue(queue_path) as queue, PostStore() as store:
+            logging.info(f"Worker {worker_id} started on stages: {', '.join(stages or QUEUE_STAGES)}")
+            while True:
+                if tasks_since_report and (tasks_since_report >= report_every or time.monotonic() - last_report >= report_interval):
+                    finish_run({"worker": worker_id}, **report_paths)
+                    start_run()
+                    tasks_since_report, last_report = 0, time.monotonic()
+                task = queue.lease(worker_id, stages)
+                if task is None:
+                    if until_empty:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+                try:
+                    with queue.heartbeat(task), metrics.timer("item_duration_seconds", stage=task["stage"]):
+                        handle_task(task, queue, store)
+                except Exception as e:
+                    queue.fail(task, str(e))
+                    metrics.inc("stage_items_total", stage=task["stage"], result="error")
+                    logging.error(f"Task {task['stage']} {task['key']} failed (attempt {task['attempts']}): {e}")
+                else:
+                    queue.complete(task)
+                    metrics.inc("stage_items_total", stage=task["stage"], result="ok")
+                tasks_since_report += 1
+    finally:
+        if tasks_since_report:
+            finish_run({"worker": worker_id}, **report_paths)
+
+def run_workers(processes=1, **kwargs):
+    if processes <= 1:
+        run_worker(**kwargs)
+        return
+    workers = [multiprocessing.Process(target=run_worker, kwargs=kwargs) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
 
-    print("Ingestion completed. Processing articles...")
-    process()
-    
-    print("Processing completed. Generating images...")
-    generate_images()
-    
 
 if __name__ == "__main__":
-    run_pipeline()
-    print("Pipeline executed successfully.")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the CSIROinfluencer pipeline")
+    parser.add_argument("--seed", action="store_true", help="Queue a crawl of every journal for queue workers")
+    parser.add_argument("--worker", action="store_true", help="Run queue workers instead of the whole pipeline")
+    parser.add_argument("--stages", nargs="+", choices=QUEUE_STAGES, help="Stages this worker takes tasks from")
+    parser.add_argument("--processes", type=int, default=1, help="Number of worker processes to start")
+    parser.add_argument("--until-empty", action="store_true", help="Stop workers once the queue has no ready tasks")
+    parser.add_argument("--queue-status", action="store_true", help="Print task counts per stage and status")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"], help="Console log level")
+    add_profile_arguments(parser, PIPELINE_STAGES)
+    args = parser.parse_args()
+    configure_console_logging(args.log_level)
+
+    if args.seed or args.queue_status:
+        with TaskQueue() as queue:
+            if args.seed:
+                print(f"Queued {seed_queue(queue)} journals.")
+            if args.queue_status:
+                for stage, counts in queue.counts().items():
+                    print(f"{stage}: " + ", ".join(f"{status}={n}" for status, n in sorted(counts.items())))
+    elif args.worker:
+        run_workers(args.processes, stages=args.stages, until_empty=args.until_empty)
+    else:
+        try:
+            with pipeline_lock():
+                session = ProfileSession(args.profiler, args.profile_dir) if args.profile is not None else None
+                run_pipeline(session, args.profile)
+        except PipelineLocked as e:
+            logging.warning(f"{e}, skipping this run.")
+        else:
+            logging.info("Pipeline executed successfully.")
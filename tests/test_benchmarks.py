@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from benchmarks.standins import (
+    StandinServer, load_corpus, replica_page, make_journal_handler, make_openai_handler, make_pexels_handler,
+)
+from benchmarks.run import format_runs
+
+PAGE = (
+    '<html><head><meta name="citation_title" content="Soil carbon">'
+    '<meta name="citation_doi" content="10.1071/WF24140">'
+    '<meta name="citation_pdf_url" content="https://example.org/WF24140"></head></html>'
+)
+
+
+def test_load_corpus_groups_pages_by_links_file(tmp_path):
+    raw_dir, links_dir = tmp_path / "raw", tmp_path / "links"
+    raw_dir.mkdir()
+    links_dir.mkdir()
+    (raw_dir / "a.html").write_text(PAGE)
+    (raw_dir / "b.html").write_text(PAGE.replace("WF24140", "BT23001"))
+    (links_dir / "wf_links.json").write_text(json.dumps(["https://www.publish.csiro.au/WF/WF24140"]))
+
+    corpus = load_corpus(str(raw_dir), str(links_dir))
+
+    assert [article_id for article_id, _ in corpus["wf"]] == ["WF24140"]
+    # Pages no links file mentions fall back to the journal in their DOI
+    assert [article_id for article_id, _ in corpus["bt"]] == ["BT23001"]
+    assert load_corpus(str(raw_dir), str(links_dir), max_articles=1) == {"wf": corpus["wf"]}
+
+def test_replica_page_gives_distinct_title_and_doi():
+    html = replica_page(PAGE, 3)
+    assert 'content="Soil carbon (replica 3)"' in html
+    assert 'content="10.1071/WF24140-r3"' in html
+    assert replica_page(PAGE, 0) == PAGE
+
+def test_journal_standin_lists_replicas_and_serves_them():
+    with StandinServer(make_journal_handler({"wf": [("WF24140", PAGE)]}, scale=2)) as site:
+        listing = requests.get(f"{site.url}/wf", timeout=5).text
+        replica = requests.get(f"{site.url}/WF/WF24140-r1", timeout=5)
+        missing = requests.get(f"{site.url}/WF/WF99999", timeout=5)
+
+    assert listing.count("<article>") == 2
+    assert 'href="/WF/WF24140-r1"' in listing
+    assert "10.1071/WF24140-r1" in replica.text
+    assert missing.status_code == 404
+
+def test_openai_standin_returns_structured_post():
+    with StandinServer(make_openai_handler(latency=0)) as api:
+        response = requests.post(f"{api.url}/v1/responses", json={"model": "m", "input": "Summarise"}, timeout=5).json()
+
+    post = json.loads(response["output"][0]["content"][0]["text"])
+    assert set(post) == {"hook", "caption", "hashtags", "image_prompt"}
+    assert response["usage"]["total_tokens"] > 0
+
+def test_pexels_standin_serves_search_and_renditions():
+    photos = [{"original": b"original-bytes", "large": b"large-bytes"}]
+    with StandinServer(make_pexels_handler(photos)) as api:
+        search = requests.get(f"{api.url}/v1/search", params={"query": "coral"}, timeout=5).json()
+        large = requests.get(search["photos"][0]["src"]["large"], timeout=5)
+
+    assert large.content == b"large-bytes"
+    assert large.headers["Content-Type"] == "image/jpeg"
+
+def test_format_runs_compares_throughput_with_baseline():
+    result = {"seconds": 1.0, "items": 10, "errors": 0, "throughput_per_second": 10.0, "p50_ms": 5.0, "p95_ms": 9.0, "peak_rss_mb": 100.0}
+    baseline = {"runs": [{"scale": 1, "stages": {"process": dict(result, throughput_per_second=8.0)}}]}
+
+    table = format_runs([{"scale": 1, "stages": {"process": result}}], baseline)
+
+    assert "+25.0% items/s" in table
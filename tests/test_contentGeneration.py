@@ -1,5 +1,6 @@
 import os
 import pytest
+import requests
 from unittest import mock
 from PIL import Image
 # import io (removed unused import)
@@ -7,6 +8,7 @@ import sys
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from layers import contentGeneration
+from layers.store import PostStore
 
 sys.modules['PIL.ImageFont'] = mock.Mock()
 sys.modules['PIL.ImageDraw'] = mock.Mock()
@@ -22,27 +24,7 @@ def sample_post_data():
         "article_title": "Test Article"
     }
 
-def test_load_generated_images_returns_set(tmp_path):
-    file = tmp_path / "generated_images.txt"
-    file.write_text("Title1\nTitle2\n")
-    result = contentGeneration.load_generated_images(str(file))
-    assert isinstance(result, set)
-    assert "Title1" in result
-    assert "Title2" in result
-
-def test_load_generated_images_returns_empty_set_if_file_missing(tmp_path):
-    file = tmp_path / "does_not_exist.txt"
-    result = contentGeneration.load_generated_images(str(file))
-    assert result == set()
-
-def test_save_generated_image_writes_to_file(tmp_path):
-    file = tmp_path / "generated_images.txt"
-    contentGeneration.save_generated_image("TestTitle", str(file))
-    with open(file) as f:
-        lines = f.readlines()
-    assert "TestTitle\n" in lines
-
-@mock.patch("layers.contentGeneration.requests.get")
+@mock.patch("layers.resilience.requests.get")
 @mock.patch("layers.contentGeneration.PEXELS_API_KEY", "fake_api_key")
 def test_fetch_pexels_image_success(mock_get):
     # Mock Pexels API response
@@ -73,18 +55,121 @@ def test_fetch_pexels_image_no_query():
     with pytest.raises(ValueError, match="No image prompt provided. Please provide a valid query string."):
         contentGeneration.fetch_pexels_image("")
 
+@mock.patch("layers.resilience.requests.get")
+@mock.patch("layers.contentGeneration.PEXELS_API_KEY", "fake_api_key")
+def test_fetch_pexels_image_download_error_raises(mock_get):
+    search_response = mock.Mock(status_code=200)
+    search_response.json.return_value = {
+        "photos": [{"src": {"original": "http://example.com/image.jpg"}, "photographer": "John Doe"}]
+    }
+    # A 404 page must not be handed to Pillow as if it were the image
+    download_response = requests.Response()
+    download_response.status_code = 404
+    download_response.url = "http://example.com/image.jpg"
+    mock_get.side_effect = [search_response, download_response]
+    with pytest.raises(requests.HTTPError):
+        contentGeneration.fetch_pexels_image("nature")
 
 def test_generate_images_skips_generated(monkeypatch, tmp_path):
-    # Prepare generated images file
-    gen_file = tmp_path / "generated_images.txt"
-    gen_file.write_text("Test Article\n")
     # Prepare posts.jsonl
     posts_file = tmp_path / "posts.jsonl"
-    posts_file.write_text('{"article_title": "Test Article", "hook": "h", "image_prompt": "p"}\n')
-    # Patch functions
-    monkeypatch.setattr(contentGeneration, "load_generated_images", lambda _=None: {"Test Article"})
-    monkeypatch.setattr(contentGeneration, "create_post_image", lambda _: Image.new("RGB", (1080, 1080)))
-    monkeypatch.setattr(contentGeneration, "save_generated_image", lambda *_: None)
-    # Patch open to avoid file writing
-    with mock.patch("builtins.open", mock.mock_open(read_data='{"article_title": "Test Article", "hook": "h", "image_prompt": "p"}\n')):
-        contentGeneration.generate_images()
\ No newline at end of file
+    posts_file.write_text('{"article_title": "Test Article", "doi": "10.1071/WF1", "hook": "h", "image_prompt": "p"}\n')
+    checkpoint_file = tmp_path / "posts_checkpoint.txt"
+    store = PostStore(str(tmp_path / "store.db"), legacy_posts_file=None)
+    store.add_asset("10.1071/wf1", "abc", "output/images/ab/c/abc.jpg")
+    create_post_image = mock.Mock()
+    monkeypatch.setattr(contentGeneration, "create_post_image", create_post_image)
+    contentGeneration.generate_images(str(posts_file), str(checkpoint_file), store)
+    create_post_image.assert_not_called()
+    assert contentGeneration.load_checkpoint(str(checkpoint_file)) == posts_file.stat().st_size
+
+def test_iter_posts_resumes_from_offset_and_skips_partial_line(tmp_path):
+    posts_file = tmp_path / "posts.jsonl"
+    first = '{"article_title": "First"}\n'
+    posts_file.write_text(first + '{"article_title": "Second"}\n{"article_title": "Thi')
+    posts = list(contentGeneration.iter_posts(str(posts_file), len(first)))
+    assert [post["article_title"] for post, _, _ in posts] == ["Second"]
+    assert posts[0][1] == len(first) + len('{"article_title": "Second"}\n')
+
+def test_generate_images_checkpoint_moves_past_failures(monkeypatch, tmp_path):
+    posts_file = tmp_path / "posts.jsonl"
+    posts_file.write_text(
+        '{"article_title": "Broken", "doi": "10.1/broken"}\n'
+        'not json\n'
+        '{"article_title": "Later", "doi": "10.1/later"}\n'
+    )
+    checkpoint_file = tmp_path / "posts_checkpoint.txt"
+    store = PostStore(str(tmp_path / "store.db"), legacy_posts_file=None)
+    store.add_asset("10.1/later", "b", "b.jpg")
+    monkeypatch.setattr(contentGeneration, "create_post_image", mock.Mock(side_effect=ValueError("No image prompt")))
+    contentGeneration.generate_images(str(posts_file), str(checkpoint_file), store)
+    # Neither the failed post nor the malformed line pins the checkpoint
+    assert contentGeneration.load_checkpoint(str(checkpoint_file)) == posts_file.stat().st_size
+    assert [post["doi"] for post in store.render_failures()] == ["10.1/broken"]
+
+    # The next run retries the failure from the store, without rescanning posts.jsonl
+    render_post = mock.Mock()
+    monkeypatch.setattr(contentGeneration, "render_post", render_post)
+    monkeypatch.setattr(contentGeneration, "iter_posts", mock.Mock(return_value=iter([])))
+    contentGeneration.generate_images(str(posts_file), str(checkpoint_file), store)
+    assert render_post.call_args.args[0]["doi"] == "10.1/broken"
+    assert store.render_failures() == []
+
+def test_generate_images_saves_checkpoint_when_interrupted(monkeypatch, tmp_path):
+    posts_file = tmp_path / "posts.jsonl"
+    first = '{"article_title": "Done", "doi": "10.1/done"}\n'
+    posts_file.write_text(first + '{"article_title": "Next", "doi": "10.1/next"}\n')
+    checkpoint_file = tmp_path / "posts_checkpoint.txt"
+    store = PostStore(str(tmp_path / "store.db"), legacy_posts_file=None)
+    store.add_asset("10.1/done", "a", "a.jpg")
+    monkeypatch.setattr(contentGeneration, "render_post", mock.Mock(side_effect=KeyboardInterrupt))
+    with pytest.raises(KeyboardInterrupt):
+        contentGeneration.generate_images(str(posts_file), str(checkpoint_file), store)
+    assert contentGeneration.load_checkpoint(str(checkpoint_file)) == len(first)
+
+def test_generate_images_stops_between_posts(monkeypatch, tmp_path):
+    import threading
+    posts_file = tmp_path / "posts.jsonl"
+    first = '{"article_title": "A", "doi": "10.1/a"}\n'
+    posts_file.write_text(first + '{"article_title": "B", "doi": "10.1/b"}\n')
+    checkpoint_file = tmp_path / "posts_checkpoint.txt"
+    store = PostStore(str(tmp_path / "store.db"), legacy_posts_file=None)
+    stop_event = threading.Event()
+    rendered = []
+    def render_then_stop(post_data, store):
+        rendered.append(post_data["doi"])
+        stop_event.set()
+    monkeypatch.setattr(contentGeneration, "render_post", render_then_stop)
+    contentGeneration.generate_images(str(posts_file), str(checkpoint_file), store, stop_event=stop_event)
+    assert rendered == ["10.1/a"]
+    # The next run resumes at the post it didn't get to
+    assert contentGeneration.load_checkpoint(str(checkpoint_file)) == len(first)
+
+@mock.patch("layers.contentGeneration.fetch_pexels_image")
+def test_create_post_image_draft_scale(mock_fetch, sample_post_data):
+    mock_fetch.return_value = (Image.new("RGBA", (400, 300)), "Jane Doe")
+    img = contentGeneration.create_post_image(sample_post_data, scale=0.25)
+    assert img.size == (270, 270)
+    # Drafts ask Pexels for a small rendition rather than the original
+    assert mock_fetch.call_args.kwargs["size"] == "medium"
+
+def test_make_contact_sheet_grid():
+    sheet = contentGeneration.make_contact_sheet([Image.new("RGB", (100, 100))] * 5, tile_size=100)
+    assert sheet.size == (300, 200)
+
+def test_generate_drafts_writes_contact_sheet(monkeypatch, tmp_path):
+    posts_file = tmp_path / "posts.jsonl"
+    posts_file.write_text("".join(f'{{"article_title": "T{i}", "doi": "10.1/{i}"}}\n' for i in range(5)))
+    output_path = tmp_path / "drafts" / "sheet.jpg"
+    rendered = []
+    def fake_create_post_image(post, scale):
+        rendered.append(post["article_title"])
+        return Image.new("RGB", (100, 100))
+    monkeypatch.setattr(contentGeneration, "create_post_image", fake_create_post_image)
+    make_contact_sheet = mock.Mock()
+    monkeypatch.setattr(contentGeneration, "make_contact_sheet", make_contact_sheet)
+    result = contentGeneration.generate_drafts(str(posts_file), str(output_path), scale=100 / 1080, limit=4)
+    assert result == str(output_path)
+    assert sorted(rendered) == ["T1", "T2", "T3", "T4"]
+    assert len(make_contact_sheet.call_args.args[0]) == 4
+    make_contact_sheet.return_value.save.assert_called_once_with(str(output_path), "JPEG")
@@ -131,4 +131,20 @@ def test_process_articles_exception(mock_crawl, tmp_path):
     with open(error_log) as f:
         content = f.read()
     assert "url1" in content
-    assert "fail" in content
\ No newline at end of file
+    assert "fail" in content
+@patch('layers.ingestion.save_article_data')
+def test_crawl_all_articles_stops_between_articles(mock_save, tmp_path):
+    import threading
+    stop_event = threading.Event()
+    crawled = []
+    def crawl_then_stop(link):
+        crawled.append(link)
+        # SIGTERM arrives while the first article is being crawled
+        stop_event.set()
+        return {"title": "T", "pdf_url": link}
+    with patch('layers.ingestion.crawl_article', side_effect=crawl_then_stop):
+        ingestion.crawl_all_articles(["http://a/1", "http://a/2", "http://a/3"], delay=60,
+                                     crawled_file=str(tmp_path / "crawled.txt"), crawled_urls=set(), stop_event=stop_event)
+    # The article in progress is finished and saved, the rest wait for the next run
+    assert crawled == ["http://a/1"]
+    assert mock_save.call_count == 1
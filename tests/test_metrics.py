@@ -0,0 +1,58 @@
+import os
+import sys
+import json
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from layers import metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+def test_build_report_summarises_stages_and_caches():
+    metrics.observe("stage_duration_seconds", 2.0, stage="process")
+    metrics.inc("stage_items_total", 3, stage="process", result="ok")
+    metrics.inc("stage_items_total", 1, stage="process", result="error")
+    for seconds in [0.1, 0.2, 0.3, 0.4]:
+        metrics.observe("item_duration_seconds", seconds, stage="process")
+    metrics.inc("cache_requests_total", 3, cache="rendered_images", result="hit")
+    metrics.inc("cache_requests_total", 1, cache="rendered_images", result="miss")
+    metrics.inc("llm_tokens_total", 120, model="m", type="input")
+
+    report = metrics.build_report(extra={"outbound": {}})
+    stage = report["stages"]["process"]
+    assert stage["items"] == {"ok": 3, "error": 1}
+    assert stage["items_per_second"] == 2.0
+    assert stage["item_seconds"]["p50"] == 0.3
+    assert report["caches"]["rendered_images"]["hit_rate"] == 0.75
+    assert report["llm"] == {"m": {"input_tokens": 120}}
+    assert report["outbound"] == {}
+
+def test_timer_records_even_on_error():
+    with pytest.raises(ValueError):
+        with metrics.timer("http_request_duration_seconds", host="example.com"):
+            raise ValueError("boom")
+    assert metrics.build_report()["http"]["example.com"]["latency_seconds"]["count"] == 1
+
+def test_prometheus_text_format():
+    metrics.inc("http_response_bytes_total", 2048, host="example.com")
+    metrics.observe("http_request_duration_seconds", 0.2, host="example.com")
+    text = metrics.prometheus_text()
+    assert "# TYPE csiroinfluencer_http_response_bytes_total counter" in text
+    assert 'csiroinfluencer_http_response_bytes_total{host="example.com"} 2048' in text
+    assert 'csiroinfluencer_http_request_duration_seconds_bucket{host="example.com",le="0.1"} 0' in text
+    assert 'csiroinfluencer_http_request_duration_seconds_bucket{host="example.com",le="0.25"} 1' in text
+    assert 'csiroinfluencer_http_request_duration_seconds_count{host="example.com"} 1' in text
+
+def test_write_report_writes_all_outputs(tmp_path):
+    metrics.inc("stage_items_total", stage="ingest", result="ok")
+    json_path, prom_path, history_path = tmp_path / "report.json", tmp_path / "metrics.prom", tmp_path / "history.jsonl"
+    metrics.write_report(str(json_path), str(prom_path), str(history_path))
+    metrics.write_report(str(json_path), str(prom_path), str(history_path))
+    assert json.loads(json_path.read_text())["stages"]["ingest"]["items"] == {"ok": 1}
+    assert "stage_items_total" in prom_path.read_text()
+    assert len(history_path.read_text().splitlines()) == 2
@@ -0,0 +1,114 @@
+import os
+import sys
+import json
+import time
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import orchestration
+import daemon
+
+
+def test_pipeline_lock_prevents_overlap(tmp_path):
+    lock_file = str(tmp_path / "pipeline.lock")
+    with orchestration.pipeline_lock(lock_file):
+        with pytest.raises(orchestration.PipelineLocked):
+            with orchestration.pipeline_lock(lock_file):
+                pass
+    # Released once the first holder exits
+    with orchestration.pipeline_lock(lock_file):
+        pass
+
+def test_stage_schedule_next_applies_jitter():
+    stage = daemon.Stage("test", lambda: None, interval=100, jitter=0.1)
+    before = time.monotonic()
+    stage.schedule_next()
+    assert before + 90 <= stage.next_run <= time.monotonic() + 110
+
+def test_run_stage_survives_failure(monkeypatch, tmp_path):
+    monkeypatch.setattr(daemon, "pipeline_lock", lambda: orchestration.pipeline_lock(str(tmp_path / "pipeline.lock")))
+    monkeypatch.setattr(daemon, "finish_run", lambda: None)
+    def fail():
+        raise Exception("boom")
+    stage = daemon.Stage("fail", fail, interval=60)
+    # run_stage doesn't touch the daemon's warm state, so skip __init__
+    daemon.PipelineDaemon.run_stage(object.__new__(daemon.PipelineDaemon), stage)
+    assert stage.next_run > time.monotonic()
+
+def test_handle_task_chains_stages(monkeypatch, tmp_path):
+    from unittest import mock
+    from layers.workqueue import TaskQueue
+    article = {'title': 'A', 'authors': [], 'abstract': 'Abs', 'publication_date': '2025/05/01',
+               'journal_name': 'J', 'doi': '10.1/A', 'pdf_url': 'http://a.com/pdf'}
+    monkeypatch.setattr(orchestration, "load_crawled_urls", lambda: set())
+    monkeypatch.setattr(orchestration, "crawl_journal", lambda url: ["http://a.com/1"])
+    monkeypatch.setattr(orchestration, "crawl_article", lambda url: article)
+    monkeypatch.setattr(orchestration, "save_article_data", mock.Mock())
+    monkeypatch.setattr(orchestration, "save_crawled_url", mock.Mock())
+    monkeypatch.setattr(orchestration, "process_article", lambda article, store: {"article_title": article["title"], "doi": article["doi"]})
+    render_post = mock.Mock()
+    monkeypatch.setattr(orchestration, "render_post", render_post)
+    store = mock.Mock()
+    store.get_asset.return_value = None
+
+    with TaskQueue(str(tmp_path / "queue.db")) as queue:
+        queue.enqueue("crawl_journal", "http://a.com/j", {"url": "http://a.com/j"})
+        while (task := queue.lease("worker-1")) is not None:
+            orchestration.handle_task(task, queue, store, delay=0)
+            queue.complete(task)
+        assert queue.counts() == {stage: {"done": 1} for stage in orchestration.QUEUE_STAGES}
+    render_post.assert_called_once_with({"article_title": "A", "doi": "10.1/A"}, store)
+
+def test_crawl_article_retry_does_not_save_twice(monkeypatch):
+    from unittest import mock
+    url = "http://a.com/1"
+    monkeypatch.setattr(orchestration, "crawl_article", lambda url: {"title": "A", "doi": "10.1/A", "pdf_url": url})
+    # The previous attempt saved the article but crashed before completing the task
+    monkeypatch.setattr(orchestration, "load_crawled_urls", lambda: {url})
+    save_article_data = mock.Mock()
+    monkeypatch.setattr(orchestration, "save_article_data", save_article_data)
+    queue = mock.Mock()
+    orchestration.handle_task({"stage": "crawl_article", "payload": {"url": url}}, queue, mock.Mock(), delay=0)
+    save_article_data.assert_not_called()
+    assert queue.enqueue.call_args.args[0] == "process"
+
+def test_run_worker_writes_periodic_reports(monkeypatch, tmp_path):
+    from layers.store import PostStore
+    from layers.workqueue import TaskQueue
+    queue_path = str(tmp_path / "queue.db")
+    with TaskQueue(queue_path) as queue:
+        for n in range(5):
+            queue.enqueue("render", f"10.1/{n}")
+    monkeypatch.setattr(orchestration, "PostStore", lambda: PostStore(str(tmp_path / "store.db"), legacy_posts_file=None))
+    monkeypatch.setattr(orchestration, "handle_task", lambda task, queue, store: None)
+    reports = []
+    monkeypatch.setattr(orchestration, "finish_run", lambda extra=None, **kwargs: reports.append(orchestration.metrics.build_report(extra)))
+
+    orchestration.run_worker(until_empty=True, queue_path=queue_path, report_every=2, report_dir=str(tmp_path))
+
+    # Every 2 tasks, plus the last task when the worker stops
+    assert [r["stages"]["render"]["items"]["ok"] for r in reports] == [2, 2, 1]
+    assert all("worker" in r for r in reports)
+
+def test_workers_write_their_own_report_files(monkeypatch, tmp_path):
+    from layers.store import PostStore
+    from layers.workqueue import TaskQueue
+    queue_path = str(tmp_path / "queue.db")
+    monkeypatch.setattr(orchestration, "PostStore", lambda: PostStore(str(tmp_path / "store.db"), legacy_posts_file=None))
+    monkeypatch.setattr(orchestration, "handle_task", lambda task, queue, store: None)
+
+    for worker_id, tasks in [("host-1", 2), ("host-2", 3)]:
+        with TaskQueue(queue_path) as queue:
+            for n in range(tasks):
+                queue.enqueue("render", f"{worker_id}/{n}")
+        orchestration.run_worker(until_empty=True, queue_path=queue_path, worker_id=worker_id, report_dir=str(tmp_path))
+
+    for worker_id, tasks in [("host-1", 2), ("host-2", 3)]:
+        paths = orchestration.worker_report_paths(worker_id, str(tmp_path))
+        with open(paths["json_path"]) as f:
+            assert json.load(f)["stages"]["render"]["items"]["ok"] == tasks
+        with open(paths["prom_path"]) as f:
+            # Series carry the worker label, so a textfile collector can read every worker's file at once
+            assert f'stage_items_total{{result="ok",stage="render",worker="{worker_id}"}} {tasks}' in f.read()
+    with open(tmp_path / "run_reports.jsonl") as f:
+        assert [json.loads(line)["worker"] for line in f] == ["host-1", "host-2"]
@@ -53,7 +53,8 @@ def test_generate_structured_instagram_post_calls_openai(monkeypatch):
 def test_process_runs(monkeypatch):
     # Patch get_articles and process_articles
     monkeypatch.setattr(processing, "get_articles", lambda: [{"title": "T", "abstract": "A", "pdf_url": "U"}])
-    monkeypatch.setattr(processing, "process_articles", lambda articles: [{"hook": "H", "caption": "C", "hashtags": ["#h"], "image_prompt": "I", "article_link": "U", "article_title": "T"}])
+    monkeypatch.setattr(processing, "process_articles", lambda articles, store=None, stop_event=None: [{"hook": "H", "caption": "C", "hashtags": ["#h"], "image_prompt": "I", "article_link": "U", "article_title": "T"}])
+    monkeypatch.setattr(processing, "PostStore", MagicMock())
     result = processing.process()
     assert isinstance(result, list)
     assert result[0]["hook"] == "H"
@@ -0,0 +1,47 @@
+import os
+import sys
+import json
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from layers import profiling
+
+
+def busy_work():
+    total = 0
+    deadline = time.perf_counter() + 0.1
+    while time.perf_counter() < deadline:
+        total += sum(range(1000))
+    return total
+
+def test_cprofile_stage_writes_artefacts(tmp_path):
+    session = profiling.ProfileSession("cprofile", str(tmp_path))
+    with session.stage("process"):
+        busy_work()
+    files = os.listdir(session.output_dir)
+    assert {"process.prof", "process.txt", "summary.json", "summary.txt"} <= set(files)
+    summary = json.loads(open(os.path.join(session.output_dir, "summary.json")).read())
+    assert summary["process"]["peak_memory_bytes"] >= 0
+    assert any("busy_work" in h["function"] for h in summary["process"]["hotspots"])
+
+def test_sampling_stage_finds_hotspot(tmp_path):
+    session = profiling.ProfileSession("sample", str(tmp_path))
+    with session.stage("ingest"):
+        busy_work()
+    assert os.path.exists(os.path.join(session.output_dir, "ingest.folded"))
+    hotspots = session.results["ingest"]["hotspots"]
+    # Frames above the with block (pytest, this test) are cut, so busy_work is the top hotspot
+    assert "busy_work" in hotspots[0]["function"]
+    assert not any("test_sampling_stage_finds_hotspot" in h["function"] for h in hotspots)
+    assert "== ingest:" in session.summary_text()
+
+def test_maybe_profile_only_profiles_chosen_stages(tmp_path):
+    session = profiling.ProfileSession("cprofile", str(tmp_path))
+    with profiling.maybe_profile(session, "ingest", ["process"]):
+        pass
+    with profiling.maybe_profile(None, "ingest"):
+        pass
+    assert session.results == {}
+    with profiling.maybe_profile(session, "process", []):
+        pass
+    assert list(session.results) == ["process"]
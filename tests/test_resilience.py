@@ -0,0 +1,83 @@
+import os
+import sys
+import pytest
+import requests
+from unittest.mock import patch, MagicMock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from layers import resilience
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(resilience.time, "sleep", sleeps.append)
+    resilience.reset_stats()
+    return sleeps
+
+def response(status, headers=None):
+    r = MagicMock()
+    r.status_code = status
+    r.headers = headers or {}
+    return r
+
+@patch('requests.get')
+def test_resilient_get_retries_server_errors(mock_get, no_sleep):
+    mock_get.side_effect = [response(503), response(200)]
+    r = resilience.resilient_get('http://retry.example/page')
+    assert r.status_code == 200
+    assert mock_get.call_args.kwargs["timeout"] == resilience.DEFAULT_TIMEOUT
+    assert resilience.get_stats()["retry.example"]["retries"] == 1
+
+@patch('requests.get')
+def test_resilient_get_honours_retry_after(mock_get, no_sleep):
+    mock_get.side_effect = [response(429, {"Retry-After": "7"}), response(200)]
+    resilience.resilient_get('http://ratelimit.example/page')
+    assert no_sleep == [7.0]
+
+@patch('requests.get')
+def test_resilient_get_does_not_retry_client_errors(mock_get):
+    mock_get.return_value = response(404)
+    assert resilience.resilient_get('http://notfound.example/page').status_code == 404
+    assert mock_get.call_count == 1
+
+@patch('requests.get', side_effect=requests.ConnectionError("down"))
+def test_circuit_opens_and_fails_fast(mock_get):
+    with pytest.raises(requests.ConnectionError):
+        resilience.resilient_get('http://outage.example/a', retries=4)
+    assert mock_get.call_count == 5
+    # The breaker is now open, so the next call fails without touching the network
+    with pytest.raises(resilience.CircuitOpenError):
+        resilience.resilient_get('http://outage.example/b')
+    assert mock_get.call_count == 5
+    stats = resilience.get_stats()["outage.example"]
+    assert stats["circuit_opens"] == 1
+    assert stats["short_circuits"] == 1
+
+def test_call_with_retries_raises_non_retryable_immediately():
+    func = MagicMock(side_effect=ValueError("bad request"))
+    with pytest.raises(ValueError):
+        resilience.call_with_retries("llm.example", func, retry_on=(ConnectionError,))
+    assert func.call_count == 1
+
+def test_call_with_retries_retries_listed_exceptions():
+    func = MagicMock(side_effect=[ConnectionError("reset"), "ok"])
+    assert resilience.call_with_retries("llm2.example", func, retry_on=(ConnectionError,)) == "ok"
+    assert resilience.get_stats()["llm2.example"] == {"calls": 2, "retries": 1, "failures": 0, "short_circuits": 0, "circuit_opens": 0}
+
+def test_parse_retry_after_http_date():
+    assert resilience.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert resilience.parse_retry_after("garbage") is None
+
+@patch('requests.get', side_effect=requests.exceptions.ChunkedEncodingError("cut off"))
+def test_unretried_request_error_settles_half_open_trial(mock_get):
+    breaker = resilience.get_breaker("trial.example")
+    breaker.failures, breaker.opened_at = 5, 0.0  # open, and past its reset timeout
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        resilience.resilient_get('http://trial.example/a')
+    assert not breaker.trial_in_flight
+    # The failed trial re-opens the circuit until the next reset timeout, rather than for good
+    breaker.opened_at = 0.0
+    mock_get.side_effect = None
+    mock_get.return_value = response(200)
+    assert resilience.resilient_get('http://trial.example/b').status_code == 200
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from layers import store
+
+
+def test_article_id_prefers_doi_then_link():
+    assert store.article_id({"doi": "10.1071/WF24140", "article_link": "http://a"}) == "10.1071/wf24140"
+    assert store.article_id({"article_link": "https://www.publish.csiro.au/wf/pdf/WF24140"}) == "https://www.publish.csiro.au/wf/pdf/WF24140"
+    # Titles sharing a 50 character prefix no longer collide
+    prefix = "x" * 50
+    assert store.article_id({"article_title": prefix + "a"}) != store.article_id({"article_title": prefix + "b"})
+
+def test_sharded_path():
+    assert store.sharded_path("abcdef", root="out") == os.path.join("out", "ab", "cd", "abcdef.jpg")
+
+def test_post_lookups(tmp_path):
+    with store.PostStore(str(tmp_path / "store.db"), legacy_posts_file=None) as s:
+        s.upsert_post({"article_title": "A", "doi": "10.1/A", "publication_date": "2025/05/01"})
+        s.upsert_post({"article_title": "B", "doi": "10.1/B", "publication_date": "2025/06/01"})
+        s.upsert_post({"article_title": "A v2", "doi": "10.1/A", "publication_date": "2025/05/01"})
+        assert s.count_posts() == 2
+        assert s.get_post("10.1/a")["article_title"] == "A v2"
+        assert s.get_post_by_doi("10.1/B")["article_title"] == "B"
+        assert [p["article_title"] for p in s.posts_between("2025/01/01", "2025/05/31")] == ["A v2"]
+
+def test_save_image_is_content_addressed(tmp_path):
+    with store.PostStore(str(tmp_path / "store.db"), legacy_posts_file=None) as s:
+        path = s.save_image("10.1/a", b"jpeg bytes", root=str(tmp_path / "images"))
+        assert os.path.exists(path)
+        assert s.save_image("10.1/b", b"jpeg bytes", root=str(tmp_path / "images")) == path
+        assert s.get_asset("10.1/a")["content_hash"] == store.content_hash(b"jpeg bytes")
+
+def test_compact_jsonl_keeps_latest_record(tmp_path):
+    path = tmp_path / "posts.jsonl"
+    records = [
+        {"doi": "10.1/a", "hook": "old"},
+        {"doi": "10.1/b", "hook": "b"},
+        {"doi": "10.1/a", "hook": "new"},
+    ]
+    path.write_text("".join(json.dumps(r) + "\n" for r in records))
+    assert store.compact_jsonl(str(path)) == (3, 2)
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert lines == [{"doi": "10.1/a", "hook": "new"}, {"doi": "10.1/b", "hook": "b"}]
+
+def test_legacy_posts_are_imported_once_under_their_doi(tmp_path):
+    link = "https://www.publish.csiro.au/wf/pdf/WF24140"
+    image = tmp_path / "old.jpg"
+    image.write_bytes(b"old render")
+    # Legacy posts were saved with the article link but no DOI
+    legacy = tmp_path / "posts_with_images.jsonl"
+    legacy.write_text(json.dumps({"article_title": "Old", "article_link": link, "image_path": str(image)}) + "\n")
+    articles = tmp_path / "articles.csv"
+    articles.write_text(f"title;doi;pdf_url\nOld;10.1071/WF24140;{link}\n")
+    db_path = str(tmp_path / "store.db")
+
+    # A store that processing has already filled, as on the first run after upgrading
+    with store.PostStore(db_path, legacy_posts_file=None) as s:
+        s.upsert_post({"doi": "10.1/new", "hook": "h"})
+    with store.PostStore(db_path, legacy_posts_file=str(legacy), articles_file=str(articles)) as s:
+        # The article is reprocessed with its DOI, so the image must be found under that key
+        reprocessed = {"article_title": "Old", "article_link": link, "doi": "10.1071/WF24140"}
+        assert s.get_asset(store.article_id(reprocessed))["image_path"] == str(image)
+        s.conn.execute("DELETE FROM assets")
+        s.conn.commit()
+    with store.PostStore(db_path, legacy_posts_file=str(legacy), articles_file=str(articles)) as s:
+        assert s.get_asset(store.article_id(reprocessed)) is None
+
+def test_append_jsonl_then_compact(tmp_path):
+    path = str(tmp_path / "posts.jsonl")
+    store.append_jsonl(path, {"doi": "10.1/a", "hook": "old"})
+    store.append_jsonl(path, {"doi": "10.1/a", "hook": "new"})
+    assert store.compact_jsonl(path) == (2, 1)
@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from layers.workqueue import TaskQueue
+
+
+def test_enqueue_deduplicates(tmp_path):
+    with TaskQueue(str(tmp_path / "queue.db")) as queue:
+        assert queue.enqueue("render", "10.1/a", {"n": 1})
+        assert not queue.enqueue("render", "10.1/a", {"n": 2})
+        assert queue.enqueue("process", "10.1/a")
+        assert queue.counts() == {"render": {"pending": 1}, "process": {"pending": 1}}
+
+def test_lease_and_complete(tmp_path):
+    with TaskQueue(str(tmp_path / "queue.db")) as queue:
+        queue.enqueue("render", "10.1/a", {"n": 1})
+        task = queue.lease("worker-1")
+        assert task["payload"] == {"n": 1}
+        # Nothing else is ready while the lease is held
+        assert queue.lease("worker-2") is None
+        assert queue.complete(task)
+        assert queue.counts() == {"render": {"done": 1}}
+
+def test_lease_filters_by_stage(tmp_path):
+    with TaskQueue(str(tmp_path / "queue.db")) as queue:
+        queue.enqueue("process", "a")
+        queue.enqueue("render", "b")
+        assert queue.lease("worker-1", ["render"])["key"] == "b"
+        assert queue.lease("worker-1", ["render"]) is None
+
+def test_expired_lease_is_taken_over(tmp_path):
+    with TaskQueue(str(tmp_path / "queue.db"), lease_seconds=0) as queue:
+        queue.enqueue("render", "a")
+        crashed = queue.lease("worker-1")
+        time.sleep(0.01)
+        task = queue.lease("worker-2")
+        assert task["key"] == "a"
+        assert task["attempts"] == 2
+        # The crashed worker can no longer finish the task it lost
+        assert not queue.complete(crashed)
+        assert queue.complete(task)
+
+def test_fail_retries_with_backoff_then_gives_up(tmp_path):
+    with TaskQueue(str(tmp_path / "queue.db"), max_attempts=2, base_retry_delay=0) as queue:
+        queue.enqueue("render", "a")
+        queue.fail(queue.lease("worker-1"), "boom")
+        assert queue.counts() == {"render": {"pending": 1}}
+        queue.fail(queue.lease("worker-1"), "boom again")
+        assert queue.counts() == {"render": {"failed": 1}}
+        assert queue.lease("worker-1") is None
+
+def test_requeue_resets_finished_task(tmp_path):
+    with TaskQueue(str(tmp_path / "queue.db")) as queue:
+        queue.enqueue("crawl_journal", "j")
+        queue.complete(queue.lease("worker-1"))
+        assert queue.enqueue("crawl_journal", "j", requeue=True)
+        assert queue.counts() == {"crawl_journal": {"pending": 1}}
+
+def test_heartbeat_keeps_lease_alive(tmp_path):
+    db_path = str(tmp_path / "queue.db")
+    with TaskQueue(db_path, lease_seconds=0.3) as queue:
+        queue.enqueue("render", "a")
+        task = queue.lease("worker-1")
+        with queue.heartbeat(task, interval=0.05):
+            time.sleep(0.6)
+            # Twice the lease period has passed, but the heartbeat kept the lease
+            assert queue.lease("worker-2") is None
+        assert queue.complete(task)